@@ -0,0 +1,107 @@
+import os
+import sys
+import csv
+import argparse
+import itertools
+import multiprocessing
+
+from maze import Maze
+from robot import Robot
+from tester import run_robot, score
+
+# Columns of the results table
+COLUMNS = ['maze', 'algorithm', 'explore', 'score', 'first_run_moves',
+           'final_run_moves', 'explored', 'error']
+
+
+def run_config(config):
+    """
+    Runs one (maze, algorithm, explore) combination as tester.py does and
+    returns a row of results. The robot's and tester's messages are
+    discarded.
+    """
+    maze_file, algorithm, explore = config
+    row = dict.fromkeys(COLUMNS)
+    row.update(maze=maze_file, algorithm=algorithm, explore=explore)
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        testmaze = Maze(maze_file)
+        testrobot = Robot(testmaze.dim, algorithm, explore)
+        runtimes = run_robot(testmaze, testrobot)
+    except Exception as e:
+        row['error'] = '{}: {}'.format(e.__class__.__name__, e)
+        return row
+    finally:
+        sys.stdout.close()
+        sys.stdout = stdout
+
+    if len(runtimes) > 0:
+        row['first_run_moves'] = runtimes[0]
+    if len(runtimes) == 2:
+        row['final_run_moves'] = runtimes[1]
+        row['score'] = score(runtimes)
+    row['explored'] = testrobot.terrain.get_percentage_of_maze_explored()
+    return row
+
+
+def run_batch(maze_files, algorithms=('ff', 'ar', 'mr'),
+              explore=(True, False), processes=None):
+    """
+    Runs every combination of maze file, algorithm and explore setting in
+    a process pool; returns the rows in the order of the combinations.
+    """
+    configs = list(itertools.product(maze_files, algorithms, explore))
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        return pool.map(run_config, configs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def format_table(rows):
+    """Returns the rows as a plain-text table."""
+    cells = [COLUMNS] + [['' if row[column] is None else
+                          '{:.3f}'.format(row[column]) if column == 'score' else
+                          str(row[column]) for column in COLUMNS]
+                         for row in rows]
+    widths = [max(len(line[i]) for line in cells)
+              for i in range(len(COLUMNS))]
+    return '\n'.join('  '.join(value.ljust(width)
+                               for value, width in zip(line, widths)).rstrip()
+                     for line in cells)
+
+
+def write_csv(rows, filename):
+    with open(filename, 'wb') as f_out:
+        writer = csv.DictWriter(f_out, fieldnames=COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    '''
+    Runs tester.py's evaluation for every combination of the given mazes,
+    algorithms and explore settings in parallel, and prints one table.
+    Example: python batch.py test_maze_0*.txt --csv results.csv
+    '''
+    parser = argparse.ArgumentParser(
+        description='Batch evaluation of robot configurations.')
+    parser.add_argument('mazes', nargs='+', help='maze files')
+    parser.add_argument('--algorithms', nargs='+', default=['ff', 'ar', 'mr'],
+                        choices=['ff', 'ar', 'mr'])
+    parser.add_argument('--explore', nargs='+', default=['true', 'false'],
+                        choices=['true', 'false'])
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes (default: one per CPU)')
+    parser.add_argument('--csv', help='also write the table to this file')
+    args = parser.parse_args()
+
+    rows = run_batch(args.mazes, args.algorithms,
+                     [value == 'true' for value in args.explore],
+                     args.processes)
+    print format_table(rows)
+    if args.csv:
+        write_csv(rows, args.csv)
@@ -1,5 +1,11 @@
 import numpy as np
 
+# Wall bit and index into Maze.ray_lengths for each direction
+dir_bit = {'u': 1, 'r': 2, 'd': 4, 'l': 8,
+           'up': 1, 'right': 2, 'down': 4, 'left': 8}
+dir_ray = {'u': 0, 'r': 1, 'd': 2, 'l': 3,
+           'up': 0, 'right': 1, 'down': 2, 'left': 3}
+
 class Maze(object):
     def __init__(self, filename):
         '''
@@ -17,44 +23,65 @@ class Maze(object):
         with open(filename, 'rb') as f_in:
 
             # First line should be an integer with the maze dimensions
-            self.dim = int(f_in.next())
+            self.dim = int(f_in.readline())
 
-            # Subsequent lines describe the permissability of walls
-            walls = []
-            for line in f_in:
-                walls.append(map(int,line.split(',')))
-            self.walls = np.array(walls)
+            # Subsequent lines describe the permissability of walls; they are
+            # parsed in one pass straight into a compact integer array
+            lines = [line for line in f_in.read().splitlines() if line.strip()]
+        row_lengths = set(line.count(',') + 1 for line in lines)
+        walls = np.fromstring(','.join(lines), dtype=np.uint8, sep=',')
 
         # Perform validation on maze
         # Maze dimensions
         if self.dim % 2:
             raise Exception('Maze dimensions must be even in length!')
-        if self.walls.shape != (self.dim, self.dim):
+        if len(lines) != self.dim or row_lengths != set([self.dim]) or walls.size != self.dim * self.dim:
             raise Exception('Maze shape does not match dimension attribute!')
+        self.walls = walls.reshape(self.dim, self.dim)
 
-        # Wall permeability
-        wall_errors = []
-        # vertical walls
-        for x in range(self.dim-1):
-            for y in range(self.dim):
-                if (self.walls[x,y] & 2 != 0) != (self.walls[x+1,y] & 8 != 0):
-                    wall_errors.append([(x,y), 'v'])
-        # horizontal walls
-        for y in range(self.dim-1):
-            for x in range(self.dim):
-                if (self.walls[x,y] & 1 != 0) != (self.walls[x,y+1] & 4 != 0):
-                    wall_errors.append([(x,y), 'h'])
+        # Wall permeability (whole-array comparisons of neighbouring cells)
+        # vertical walls: right edge of (x, y) vs left edge of (x+1, y)
+        vertical = (self.walls[:-1, :] & 2 != 0) != (self.walls[1:, :] & 8 != 0)
+        # horizontal walls: top edge of (x, y) vs bottom edge of (x, y+1)
+        horizontal = (self.walls[:, :-1] & 1 != 0) != (self.walls[:, 1:] & 4 != 0)
 
-        if wall_errors:
-            for cell, wall_type in wall_errors:
-                if wall_type == 'v':
-                    cell2 = (cell[0]+1, cell[1])
-                    print 'Inconsistent vertical wall betweeen {} and {}'.format(cell, cell2)
-                else:
-                    cell2 = (cell[0], cell[1]+1)
-                    print 'Inconsistent horizontal wall betweeen {} and {}'.format(cell, cell2)
+        if vertical.any() or horizontal.any():
+            # Report in the same order as a scan over x, then y (vertical)
+            # and over y, then x (horizontal)
+            for x, y in np.argwhere(vertical).tolist():
+                print 'Inconsistent vertical wall betweeen {} and {}'.format((x, y), (x+1, y))
+            for y, x in np.argwhere(horizontal.T).tolist():
+                print 'Inconsistent horizontal wall betweeen {} and {}'.format((x, y), (x, y+1))
             raise Exception('Consistency errors found in wall specifications!')
 
+        # Sensor readings for every cell and direction, computed once
+        self.ray_lengths = self.compute_ray_lengths()
+
+    def compute_ray_lengths(self):
+        """
+        Returns a (dim, dim, 4) array with the number of open cells to the
+        nearest wall from every cell, looking up, right, down and left (in
+        that order, see dir_ray). Past the edge of the grid counts as a wall.
+        """
+        dim = self.dim
+        position = np.arange(dim)
+        rays = np.empty((dim, dim, 4), dtype=np.int32)
+        # (wall bit, axis, step) for up, right, down, left
+        for ray, (bit, axis, step) in enumerate([(1, 1, 1), (2, 0, 1), (4, 1, -1), (8, 0, -1)]):
+            blocked = self.walls & bit == 0
+            pos = position[np.newaxis, :] if axis == 1 else position[:, np.newaxis]
+            pos = np.broadcast_to(pos, (dim, dim))
+            if step > 0:
+                # position of the first blocked cell at or after each cell
+                stop = np.where(blocked, pos, dim)
+                stop = np.flip(np.minimum.accumulate(np.flip(stop, axis), axis=axis), axis)
+                rays[:, :, ray] = stop - pos
+            else:
+                # position of the last blocked cell at or before each cell
+                stop = np.maximum.accumulate(np.where(blocked, pos, -1), axis=axis)
+                rays[:, :, ray] = pos - stop
+        return rays
+
 
     def is_permissible(self, cell, direction):
         """
@@ -63,11 +90,9 @@ class Maze(object):
         input as single letter 'u', 'r', 'd', 'l', or complete words 'up', 
         'right', 'down', 'left'.
         """
-        dir_int = {'u': 1, 'r': 2, 'd': 4, 'l': 8,
-                   'up': 1, 'right': 2, 'down': 4, 'left': 8}
         try:
-            return (self.walls[tuple(cell)] & dir_int[direction] != 0)
-        except:
+            return (self.walls[cell[0], cell[1]] & dir_bit[direction] != 0)
+        except (KeyError, IndexError):
             print 'Invalid direction provided!'
 
 
@@ -78,17 +103,4 @@ class Maze(object):
         may be input as a single letter 'u', 'r', 'd', 'l', or complete words
         'up', 'right', 'down', 'left'.
         """
-        dir_move = {'u': [0, 1], 'r': [1, 0], 'd': [0, -1], 'l': [-1, 0],
-                    'up': [0, 1], 'right': [1, 0], 'down': [0, -1], 'left': [-1, 0]}
-
-        sensing = True
-        distance = 0
-        curr_cell = list(cell) # make copy to preserve original
-        while sensing:
-            if self.is_permissible(curr_cell, direction):
-                distance += 1
-                curr_cell[0] += dir_move[direction][0]
-                curr_cell[1] += dir_move[direction][1]
-            else:
-                sensing = False
-        return distance
\ No newline at end of file
+        return int(self.ray_lengths[cell[0], cell[1], dir_ray[direction]])
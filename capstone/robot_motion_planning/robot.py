@@ -1,5 +1,3 @@
-import sys
-
 from global_variables import (dir_move, dir_reverse, dir_sensors, rotations,
                               wall_index, MAX_DISTANCES, WALL_VALUE)
 from algorithms import AlwaysRight, FloodFill, ModifiedRight
@@ -7,10 +5,12 @@ from terrain import Terrain
 
 
 class Robot(object):
-    def __init__(self, maze_dim):
+    def __init__(self, maze_dim, algorithm, explore_after_center):
         """
         Used to set up attributes that the robot will use to learn and
-        navigate the maze.
+        navigate the maze. algorithm is 'ff', 'ar' or 'mr' and
+        explore_after_center is True/False (or 'true'/'false', as given on
+        the command line).
         """
 
         # Position-related attributes
@@ -38,11 +38,11 @@ class Robot(object):
         # Algorithm to use:
         self.algorithm = None
 
-        if str(sys.argv[2]).lower() == 'ff':
+        if str(algorithm).lower() == 'ff':
             self.algorithm = FloodFill()
-        elif str(sys.argv[2]).lower() == 'ar':
+        elif str(algorithm).lower() == 'ar':
             self.algorithm = AlwaysRight()
-        elif str(sys.argv[2]).lower() == 'mr':
+        elif str(algorithm).lower() == 'mr':
             self.algorithm = ModifiedRight()
         else:
             raise ValueError(
@@ -53,9 +53,9 @@ class Robot(object):
             )
 
         # Explore after reaching center of the maze:
-        if str(sys.argv[3]).lower() == 'true':
+        if str(explore_after_center).lower() == 'true':
             self.explore_after_center = True
-        elif str(sys.argv[3]).lower() == 'false':
+        elif str(explore_after_center).lower() == 'false':
             self.explore_after_center = False
         else:
             raise ValueError(
@@ -169,8 +169,8 @@ class Robot(object):
             walls = [1, 0, 1, 1]
 
         # If it had been visited before, just get those values
-        elif self.terrain.grid[x][y].visited != '':
-            walls = self.terrain.grid[x][y].get_total_walls()
+        elif self.terrain.get_cell_visited(x, y) != '':
+            walls = self.terrain.get_total_walls(x, y)
 
         # Else, get current walls. Note that it can only have real walls
         # since the location has never been visited, and imaginary walls
@@ -397,19 +397,19 @@ class Robot(object):
         rotation = 0
         movement = -1
 
-        # 2) Get reference to cell
-        cell = self.terrain.grid[x][y]
+        # 2) Get the cell's imaginary walls
+        imaginary_walls = self.terrain.get_imaginary_walls(x, y)
         # 3) Place imaginary wall behind the robot before exiting location
         reverse_direction = dir_reverse[heading]
         index = self.terrain.get_index_of_wall(reverse_direction)
-        cell.imaginary_walls[index] = 1
+        imaginary_walls[index] = 1
 
         # 4) Change the value of visited to signify dead end
-        cell.visited = 'x'
-        cell.distance = WALL_VALUE
+        self.terrain.set_cell_visited(x, y, 'x')
+        self.terrain.set_cell_distance(x, y, WALL_VALUE)
 
         # 5) Update imaginary walls and distances
-        self.terrain.update_imaginary_walls(x, y, cell.imaginary_walls)
+        self.terrain.update_imaginary_walls(x, y, imaginary_walls)
 
         return rotation, movement
 
@@ -450,7 +450,7 @@ class Robot(object):
 
         rotation = None
         movement = None
-        current_distance = self.terrain.grid[x][y].distance
+        current_distance = self.terrain.get_cell_distance(x, y)
 
         adj_distances, adj_visited = \
             self.terrain.get_adj_info(
@@ -484,12 +484,12 @@ class Robot(object):
         """
         Distances are valid if they are not walls, unvisited, or dead ends.
         """
-        return (adj_visited[i] is not ''
-                and adj_visited[i] is not 'x'
-                and adj_distances[i] is not WALL_VALUE)
+        return (adj_visited[i] != ''
+                and adj_visited[i] != 'x'
+                and adj_distances[i] != WALL_VALUE)
 
     def report_results(self):
-        distance = self.terrain.grid[0][0].distance
+        distance = self.terrain.get_cell_distance(0, 0)
         percentage = self.terrain.get_percentage_of_maze_explored()
         first_round = self.steps_first_round + self.steps_exploring
         final_round = self.steps_final_round
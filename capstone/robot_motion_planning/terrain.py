@@ -1,22 +1,103 @@
+from collections import OrderedDict
+
+import numpy as np
+
 from cell import Cell
 from global_variables import (dir_reverse, dir_sensors, opposite_wall,
                               robot_directions, wall_index, MAX_DISTANCES,
                               WALL_VALUE)
 
+# Offsets of the adjacent cells, in wall order [l, u, r, d]
+adjacent_offsets = [(-1, 0), (0, 1), (1, 0), (0, -1)]
+
+# Walls are stored as bitmasks: bit i is wall i of [l, u, r, d]
+mask_to_walls = [[(mask >> i) & 1 for i in range(4)] for mask in range(16)]
+ALL_WALLS = 15
+
+# Visited flags are stored as indices into visited_markers
+visited_markers = ['', '^', '>', 'V', '<', '*', 'e', 'x']
+visited_codes = dict((marker, code)
+                     for code, marker in enumerate(visited_markers))
+
+
+def walls_to_mask(walls):
+    """
+    :param walls: array of 0's and 1's [l, u, r, d]
+    :return: bitmask of the walls
+    """
+    mask = 0
+    for i, wall in enumerate(walls):
+        if wall:
+            mask |= 1 << i
+    return mask
+
+
+class CellQueue:
+    """
+    Work stack of the flood fill with no duplicates: the queued cells are
+    the dirty set. Pushing a cell that is already queued moves it to the
+    top, so cells are processed in the same order as with a plain stack,
+    minus the stale copies (processing a cell again when none of its
+    neighbours changed in between leaves its distance as it is).
+    """
+
+    def __init__(self):
+        self.cells = OrderedDict()
+
+    def append(self, location):
+        """
+        :param location: [x, y] (or (x, y)) of a cell to check
+        """
+        location = tuple(location)
+        if location in self.cells:
+            del self.cells[location]
+        self.cells[location] = None
+
+    def pop(self):
+        """
+        :return: (x, y) of the most recently pushed cell
+        """
+        return self.cells.popitem(last=True)[0]
+
+    def __contains__(self, location):
+        return tuple(location) in self.cells
+
+    def __len__(self):
+        return len(self.cells)
+
+    def __iter__(self):
+        return iter(self.cells)
+
 
 class Terrain:
     """
     Used by the robot to create a visual representation of the maze.
     It contains all the logic for the movement (fill maze, update distances,
     etc) as well as methods for debugging the program (i.e. printing the maze).
+    Cells are stored in maze_dim x maze_dim arrays indexed [x, y]: real and
+    imaginary walls as bitmasks, distances, and visited flags as indices
+    into visited_markers. get_cell() returns a Cell, e.g. for printing.
     """
     def __init__(self, maze_dim):
         self.maze_dim = maze_dim
-        self.grid = [[Cell() for i in range(maze_dim)] for j in range(maze_dim)]
+        shape = (maze_dim, maze_dim)
+        self.real_walls = np.zeros(shape, dtype=np.uint8)
+        self.imaginary_walls = np.zeros(shape, dtype=np.uint8)
+        self.distances = np.zeros(shape, dtype=np.int32)
+        self.visited = np.zeros(shape, dtype=np.uint8)
+        # Sides of each cell that face the outside of the maze
+        self.edges = np.zeros(shape, dtype=np.uint8)
+        self.edges[0, :] |= 1
+        self.edges[:, -1] |= 2
+        self.edges[-1, :] |= 4
+        self.edges[:, 0] |= 8
         self.fill_distances()
-        self.last_visited_cell = None
-        self.cells_to_check = []
+        self.last_visited_location = None
+        self.cells_to_check = CellQueue()
         self.visited_before_reaching_destination = []
+        # Cells popped by the last update_distances() call, and in total
+        self.cells_processed = 0
+        self.total_cells_processed = 0
 
     # --------------------------------------------
     # FOR FLOOD-FILL ALGORITHM
@@ -33,27 +114,27 @@ class Terrain:
         # Fill top left half
         for i in range(0, center):
             for j in range(center):
-                self.grid[i][j].distance = max_distance - j - i
+                self.distances[i, j] = max_distance - j - i
 
         # The two rows in the center should be equal
         for i in range(center, center + 1):
             for j in range(0, center):
-                self.grid[i][j].distance = self.grid[i - 1][j].distance
+                self.distances[i, j] = self.distances[i - 1, j]
 
         # Fill bottom left half
         for i in range(center + 1, self.maze_dim):
             for j in range(0, center):
-                self.grid[i][j].distance = self.grid[i - 1][j].distance + 1
+                self.distances[i, j] = self.distances[i - 1, j] + 1
 
         # The two rows in the center should have the same values
         for i in range(0, self.maze_dim):
             for j in range(center, center + 1):
-                self.grid[i][j].distance = self.grid[i][j - 1].distance
+                self.distances[i, j] = self.distances[i, j - 1]
 
         # Fill remaining columns
         for i in range(0, self.maze_dim):
             for j in range(center + 1, self.maze_dim):
-                self.grid[i][j].distance = self.grid[i][j - 1].distance + 1
+                self.distances[i, j] = self.distances[i, j - 1] + 1
 
     # --------------------------------------------
     # UPDATE FUNCTIONS
@@ -68,41 +149,41 @@ class Terrain:
         - Distances of adjacent cells
         """
 
-        # Get reference to current position
-        cell = self.grid[x][y]
-
         # Store real_walls only if cell has not been visited.
         # Imaginary walls can't change; walls are updated before location.
-        if cell.visited == '':
-            cell.real_walls = walls
+        if self.get_cell_visited(x, y) == '':
+            self.real_walls[x, y] = walls_to_mask(walls)
             # Set adjacent walls (i.e. right wall of cell A is left wall of B)
             self.update_adjacent_walls(x, y, walls, 'real')
 
         # Change the visual representation of the current cell
-        cell.visited = robot_directions[heading]
+        self.set_cell_visited(x, y, robot_directions[heading])
 
         # Change visual representation of the previous cell
-        self.change_visual_representation_of_prev_cell(cell, exploring)
+        self.change_visual_representation_of_prev_cell(x, y, exploring)
 
         # Set last visited cell to this cell
-        self.last_visited_cell = cell
+        self.last_visited_location = (x, y)
 
         # Update all the distances of the visited cells of the maze
         self.update_distances()
 
-    def change_visual_representation_of_prev_cell(self, curr_cell, exploring):
+    def change_visual_representation_of_prev_cell(self, x, y, exploring):
         """
         All visited cells during exploration are marked with 'e'. All
         other visited cells are marked with *, provided they are not the
         current cell the robot is standing on, or the cell is not a dead end.
         """
-        if self.last_visited_cell is not None \
-                and self.last_visited_cell != curr_cell \
-                and self.last_visited_cell.visited is not 'x':
+        if self.last_visited_location is None \
+                or self.last_visited_location == (x, y):
+            return
+
+        last_x, last_y = self.last_visited_location
+        if self.get_cell_visited(last_x, last_y) != 'x':
             if not exploring:
-                self.last_visited_cell.visited = '*'
+                self.set_cell_visited(last_x, last_y, '*')
             else:
-                self.last_visited_cell.visited = 'e'
+                self.set_cell_visited(last_x, last_y, 'e')
 
     def update_imaginary_walls(self, x, y, imaginary_walls):
         """
@@ -110,10 +191,7 @@ class Terrain:
         to account for the new found imaginary walls.
         """
 
-        # Get reference to current position
-        cell = self.grid[x][y]
-
-        cell.imaginary_walls = imaginary_walls
+        self.imaginary_walls[x, y] = walls_to_mask(imaginary_walls)
         self.update_adjacent_walls(x, y, imaginary_walls, 'imaginary')
 
         # Update all the distances of the visited cells of the maze
@@ -123,62 +201,32 @@ class Terrain:
         return wall_index[direction]
 
     def get_distance(self, x, y, direction, steps=1):
-        walls = self.grid[x][y].get_total_walls()
-        distance = WALL_VALUE
-
-        # Left
-        if direction == 'l' or direction == 'left':
-            if walls[wall_index['l']] == 0 \
-                    and self.is_valid_location(x - steps, y):
-                cell = self.grid[x - steps][y]
-                distance = self.grid[x - steps][y].distance
-        # Up
-        if direction == 'u' or direction == 'up':
-            if walls[wall_index['u']] == 0 \
-                    and self.is_valid_location(x, y + steps):
-                cell = self.grid[x][y + steps]
-                distance = self.grid[x][y + steps].distance
-        # Right
-        if direction == 'r' or direction == 'right':
-            if walls[wall_index['r']] == 0 \
-                    and self.is_valid_location(x + steps, y):
-                cell = self.grid[x + steps][y]
-                distance = self.grid[x + steps][y].distance
-        # Down
-        if direction == 'd' or direction == 'down':
-            if walls[wall_index['d']] == 0 \
-                    and self.is_valid_location(x, y - steps):
-                cell = self.grid[x][y - steps]
-                distance = self.grid[x][y - steps].distance
+        """
+        Distance of the cell steps away in the given direction, or
+        WALL_VALUE if this cell has a wall on that side or it is off the maze.
+        """
+        index = wall_index[direction]
+        walls = self.real_walls.item(x, y) | self.imaginary_walls.item(x, y)
+        new_x = x + adjacent_offsets[index][0] * steps
+        new_y = y + adjacent_offsets[index][1] * steps
 
-        return distance
+        if not walls & (1 << index) and self.is_valid_location(new_x, new_y):
+            return self.distances.item(new_x, new_y)
+        return WALL_VALUE
 
     def get_visited_flag(self, x, y, direction, steps=1):
-        walls = self.grid[x][y].get_total_walls()
-        visited = ''
-
-        # Left
-        if direction == 'l' or direction == 'left':
-            if walls[wall_index['l']] == 0 \
-                    and self.is_valid_location(x - steps, y):
-                visited = self.grid[x - steps][y].visited
-        # Up
-        if direction == 'u' or direction == 'up':
-            if walls[wall_index['u']] == 0 \
-                    and self.is_valid_location(x, y + steps):
-                visited = self.grid[x][y + steps].visited
-        # Right
-        if direction == 'r' or direction == 'right':
-            if walls[wall_index['r']] == 0 \
-                    and self.is_valid_location(x + steps, y):
-                visited = self.grid[x + steps][y].visited
-        # Down
-        if direction == 'd' or direction == 'down':
-            if walls[wall_index['d']] == 0 \
-                    and self.is_valid_location(x, y - steps):
-                visited = self.grid[x][y - steps].visited
+        """
+        Visited flag of the cell steps away in the given direction, or ''
+        if this cell has a wall on that side or it is off the maze.
+        """
+        index = wall_index[direction]
+        walls = self.real_walls.item(x, y) | self.imaginary_walls.item(x, y)
+        new_x = x + adjacent_offsets[index][0] * steps
+        new_y = y + adjacent_offsets[index][1] * steps
 
-        return visited
+        if not walls & (1 << index) and self.is_valid_location(new_x, new_y):
+            return visited_markers[self.visited.item(new_x, new_y)]
+        return ''
 
     def get_adj_info(self, x, y, heading, sensors, get_cell_behind=True):
         """
@@ -203,30 +251,44 @@ class Terrain:
         return distances, visited
 
     def get_adjacent_distances_for_cell(self, x, y):
-
+        """
+        Distances of the adjacent cells [l, u, r, d]; WALL_VALUE where there
+        is a (real or imaginary) wall or the edge of the maze.
+        """
+        blocked = (self.real_walls.item(x, y) |
+                   self.imaginary_walls.item(x, y) | self.edges.item(x, y))
         distances = list(MAX_DISTANCES)
-        distances[0] = self.get_distance(x, y, 'left')
-        distances[1] = self.get_distance(x, y, 'up')
-        distances[2] = self.get_distance(x, y, 'right')
-        distances[3] = self.get_distance(x, y, 'down')
+
+        for i, (dx, dy) in enumerate(adjacent_offsets):
+            if not blocked & (1 << i):
+                distances[i] = self.distances.item(x + dx, y + dy)
 
         return distances
 
     def update_distances(self, last_update=False):
+        """
+        Modified flood fill: pops cells from the work stack until every
+        queued cell is one more than its closest open neighbour. A cell
+        whose distance changes queues its open neighbours (not dead ends).
+        With last_update, the visited cells are checked instead, and the
+        neighbours they queue are left for the next update.
+        """
 
         if last_update:
             cells_to_check = list(self.visited_before_reaching_destination)
         else:
             cells_to_check = self.cells_to_check
 
+        self.cells_processed = 0
+        dead_end = visited_codes['x']
+
         # While stack is not empty
         while len(cells_to_check) != 0:
 
             # Update current cell and get it's distance
-            current_cell = cells_to_check.pop()
-            x = current_cell[0]
-            y = current_cell[1]
-            current_distance = self.grid[x][y].distance
+            x, y = cells_to_check.pop()
+            self.cells_processed += 1
+            current_distance = self.distances.item(x, y)
 
             # Get adjacent distances
             adj_distances = self.get_adjacent_distances_for_cell(x, y)
@@ -238,38 +300,21 @@ class Terrain:
             if current_distance != min_distance + 1 and current_distance != WALL_VALUE:
 
                 # First update this cell's distance
-                self.grid[x][y].distance = min_distance + 1
+                self.distances.itemset(x, y, min_distance + 1)
 
-                # Then push adjacent cells to the stack
+                # Then push adjacent cells to the stack (an adjacent
+                # distance other than WALL_VALUE is inside the maze)
                 for i, adj_distance in enumerate(adj_distances):
                     if adj_distance != WALL_VALUE:
-                        # Left
-                        if i == 0:
-                            new_x = x - 1
-                            new_y = y
-                        # Up
-                        elif i == 1:
-                            new_x = x
-                            new_y = y + 1
-                        # Right
-                        elif i == 2:
-                            new_x = x + 1
-                            new_y = y
-                        # Down
-                        else:
-                            new_x = x
-                            new_y = y - 1
-
-                        new_cell = self.grid[new_x][new_y]
-                        if new_cell.visited != 'x' \
-                                and self.is_valid_location(new_x, new_y):
-                            location = [new_x, new_y]
-                            self.cells_to_check.append(location)
+                        new_x = x + adjacent_offsets[i][0]
+                        new_y = y + adjacent_offsets[i][1]
+                        if self.visited.item(new_x, new_y) != dead_end:
+                            self.cells_to_check.append((new_x, new_y))
+
+        self.total_cells_processed += self.cells_processed
 
     def reset_visited_flags(self):
-        for x in range(self.maze_dim):
-            for y in range(self.maze_dim):
-                self.grid[x][y].visited = ''
+        self.visited.fill(visited_codes[''])
 
     def is_valid_location(self, x, y):
         return 0 <= x <= self.maze_dim - 1 and 0 <= y <= self.maze_dim - 1
@@ -317,10 +362,16 @@ class Terrain:
         Sets the correct value of real an imaginary walls for a given cell
         """
         if type_of_wall == 'real':
-            self.grid[x][y].real_walls[index] = value
-
+            walls = self.real_walls
         elif type_of_wall == 'imaginary':
-            self.grid[x][y].imaginary_walls[index] = value
+            walls = self.imaginary_walls
+        else:
+            return
+
+        if value:
+            walls.itemset(x, y, walls.item(x, y) | 1 << index)
+        else:
+            walls.itemset(x, y, walls.item(x, y) & ~(1 << index))
 
     def set_imaginary_walls_for_unvisited_cells(self):
         """
@@ -328,13 +379,45 @@ class Terrain:
          cells to -1 and places imaginary walls so distances can be updated
          correctly and robot can follow a logical (safe) path to the center.
         """
-        for x in range(self.maze_dim):
-            for y in range(self.maze_dim):
-                cell = self.grid[x][y]
-                if cell.visited == '':
-                    cell.distance = WALL_VALUE
-                    for i in range(4):
-                        cell.imaginary_walls[i] = 1
+        unvisited = self.visited == visited_codes['']
+        self.distances[unvisited] = WALL_VALUE
+        self.imaginary_walls[unvisited] = ALL_WALLS
+
+    # --------------------------------------------
+    # CELL ACCESS
+    # --------------------------------------------
+
+    def get_cell_distance(self, x, y):
+        return self.distances.item(x, y)
+
+    def set_cell_distance(self, x, y, distance):
+        self.distances[x, y] = distance
+
+    def get_cell_visited(self, x, y):
+        return visited_markers[self.visited.item(x, y)]
+
+    def set_cell_visited(self, x, y, visited):
+        self.visited[x, y] = visited_codes[visited]
+
+    def get_total_walls(self, x, y):
+        """
+        Get real and imaginary walls for a particular cell
+        :return: array of 0s and 1s with real and imaginary walls
+        """
+        return list(mask_to_walls[self.real_walls.item(x, y) |
+                                  self.imaginary_walls.item(x, y)])
+
+    def get_imaginary_walls(self, x, y):
+        return list(mask_to_walls[self.imaginary_walls.item(x, y)])
+
+    def get_cell(self, x, y):
+        """
+        Copy of a cell's walls, distance and visited flag as a Cell.
+        """
+        cell = Cell(list(mask_to_walls[self.real_walls.item(x, y)]),
+                    self.distances.item(x, y), self.get_cell_visited(x, y))
+        cell.imaginary_walls = self.get_imaginary_walls(x, y)
+        return cell
 
     # --------------------------------------------
     # FOR DEBUGGING
@@ -380,7 +463,8 @@ class Terrain:
         """
         mod_terrain = []
         for i in range(self.maze_dim):
-            mod_terrain.append([x[i] for x in self.grid])
+            mod_terrain.append([self.get_cell(x, i)
+                                for x in range(self.maze_dim)])
 
         print_delimiters = True
         for i, row in enumerate(reversed(mod_terrain)):
@@ -393,7 +477,8 @@ class Terrain:
         """
         mod_terrain = []
         for i in range(self.maze_dim):
-            mod_terrain.append([x[i] for x in self.grid])
+            mod_terrain.append([self.get_cell(x, i)
+                                for x in range(self.maze_dim)])
 
         for i, row in enumerate(reversed(mod_terrain)):
             self.print_row_of_cells_double(row)
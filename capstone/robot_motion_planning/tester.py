@@ -16,18 +16,11 @@ dir_reverse = {'u': 'd', 'r': 'l', 'd': 'u', 'l': 'r',
 max_time = 1000
 train_score_mult = 1/30.
 
-if __name__ == '__main__':
-    '''
-    This script tests a robot based on the code in robot.py on a maze given
-    as an argument when running the script.
-    '''
-
-    # Create a maze based on input argument on command line.
-    testmaze = Maze( str(sys.argv[1]) )
-
-    # Intitialize a robot; robot receives info about maze dimensions.
-    testrobot = Robot(testmaze.dim)
-
+def run_robot(testmaze, testrobot):
+    """
+    Runs a robot through the maze for two runs and returns the list of
+    run times (two entries if the robot completed both runs).
+    """
     # Record robot performance over two runs.
     runtimes = []
     total_time = 0
@@ -109,6 +102,28 @@ if __name__ == '__main__':
                     run_active = False
                     print "Goal found; run {} completed!".format(run)
 
+    return runtimes
+
+
+def score(runtimes):
+    return runtimes[1] + train_score_mult*runtimes[0]
+
+
+if __name__ == '__main__':
+    '''
+    This script tests a robot based on the code in robot.py on a maze given
+    as an argument when running the script.
+    '''
+
+    # Create a maze based on input argument on command line.
+    testmaze = Maze( str(sys.argv[1]) )
+
+    # Intitialize a robot; robot receives info about maze dimensions.
+    testrobot = Robot(testmaze.dim, sys.argv[2], sys.argv[3])
+
+    # Record robot performance over two runs.
+    runtimes = run_robot(testmaze, testrobot)
+
     # Report score if robot is successful.
     if len(runtimes) == 2:
-        print "Task complete! Score: {:4.3f}".format(runtimes[1] + train_score_mult*runtimes[0])
\ No newline at end of file
+        print "Task complete! Score: {:4.3f}".format(score(runtimes))
\ No newline at end of file
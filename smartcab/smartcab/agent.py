@@ -1,14 +1,20 @@
-import logging
-import random
+import argparse
+
 from environment import Agent, Environment
 from planner import RoutePlanner
+from qtable import QTable
+from replay import ReplayBuffer
 from simulator import Simulator
+from tracing import INFO, DEBUG
 
 
 class LearningAgent(Agent):
     """An agent that learns to drive in the smartcab world."""
 
-    def __init__(self, env):
+    def __init__(self, env, gamma=0.75, alpha=0.30, epsilon=0.10,
+                 array_q_table=False, shortest_path_planner=False,
+                 warm_start=None, replay_capacity=None, replay_batch_size=32,
+                 replay_updates=1):
         # sets self.env = env, state = None, next_waypoint = None,
         # and a default color
 
@@ -16,17 +22,39 @@ class LearningAgent(Agent):
 
         # override color
         self.color = 'red'
-        # simple route planner to get next_waypoint
-        self.planner = RoutePlanner(self.env, self)
+        # simple route planner to get next_waypoint (or precomputed
+        # shortest-path routing tables with shortest_path_planner=True)
+        self.planner = RoutePlanner(self.env, self,
+                                    shortest_path=shortest_path_planner)
         # TODO: Initialize any additional variables here
 
         # Keys: light-oncoming-right-left
-        self.states = self.generate_states_dict_with_empty_rewards()
+        # array_q_table=True keeps the same table as integer-encoded states in
+        # a NumPy array (same learned policy, no string keys). warm_start is a
+        # snapshot saved by save_checkpoint(), mapped copy-on-write.
+        if warm_start is not None:
+            self.q_table = QTable.load(warm_start, mmap_mode='c')
+            self.states = None
+        elif array_q_table or replay_capacity is not None:
+            self.q_table = QTable()
+            self.states = None
+        else:
+            self.q_table = None
+            self.states = self.generate_states_dict_with_empty_rewards()
 
         # Parameters
-        self.gamma = 0.75  # discount factor
-        self.alpha = 0.30  # learning rate
-        self.epsilon = 0.10  # explore vs exploit
+        self.gamma = gamma  # discount factor
+        self.alpha = alpha  # learning rate
+        self.epsilon = epsilon  # explore vs exploit
+
+        # Experience replay (optional): transitions are recorded into a
+        # fixed-size buffer and replay_updates batches of replay_batch_size
+        # are learned after every step, on top of the online update
+        self.replay = None
+        if replay_capacity is not None:
+            self.replay = ReplayBuffer(replay_capacity, random_state=self.rng.spawn().random_state)
+        self.replay_batch_size = replay_batch_size
+        self.replay_updates = replay_updates
 
         # Cumulative reward obtained:
         self.total_reward = 0
@@ -38,8 +66,9 @@ class LearningAgent(Agent):
         # Did the agent reach it's destination on time?
         self.reached_destination = False
 
-        # Logging
-        logging.basicConfig(filename='smartcab.log', level=logging.DEBUG)
+        # Learning can be switched off to evaluate the current policy
+        # (frozen Q-table, greedy actions); see Simulator.evaluate()
+        self.learning = True
 
     def generate_states_dict_with_empty_rewards(self):
 
@@ -70,17 +99,29 @@ class LearningAgent(Agent):
 
         return states
 
-    def update_state(self, inputs, deadline, next_waypoint):
+    def save_checkpoint(self, filename):
+        """Save the Q-table as a snapshot that can be memory-mapped (.npy is added to filename if missing)."""
+        if self.q_table is not None:
+            self.q_table.save(filename)
+        else:
+            QTable.from_dict(self.states).save(filename)
 
-        # Input values will serve as key in states dictionary
-        input_values = [str(value) for key, value in inputs.items()
-                        if key != 'right']
+    def update_state(self, inputs, deadline, next_waypoint):
 
         if deadline < 20:
             hurry_up = 'yes'
         else:
             hurry_up = 'no'
 
+        if self.q_table is not None:
+            return self.q_table.encoder.encode(
+                inputs['light'], inputs['oncoming'], inputs['left'], hurry_up,
+                next_waypoint)
+
+        # Input values will serve as key in states dictionary
+        input_values = [str(value) for key, value in inputs.items()
+                        if key != 'right']
+
         # Generate state base on inputs, including deadline and next_waypoint
         state = '-'.join(input_values)
         state += '-{}'.format(hurry_up)
@@ -88,16 +129,28 @@ class LearningAgent(Agent):
 
         return state
 
+    def state_key(self, state):
+        """
+        State as a string key (light-oncoming-left-hurry_up-waypoint), for
+        output that reads the same with both Q-table backends.
+        """
+        if self.q_table is not None:
+            return self.q_table.encoder.key(state)
+        return state
+
     def get_action(self, state):
         """
         Will return the action that maximizes the reward in most cases, or
         a random action in case the random number generated is less than
         self.epsilon.
         """
-        random_number = random.uniform(0, 1)
-        if random_number < self.epsilon:
+        # Never explore while learning is off (frozen policy)
+        if self.learning and self.rng.uniform(0, 1) < self.epsilon:
             # Explore: take random action
-            action = random.choice([None, 'forward', 'left', 'right'])
+            action = self.rng.choice([None, 'forward', 'left', 'right'])
+        elif self.q_table is not None:
+            # Exploit: take action with maximum reward
+            action = self.q_table.best_action(state)
         else:
             # Exploit: take action with maximum reward
             action = max(self.states[state], key=self.states[state].get)
@@ -116,10 +169,12 @@ class LearningAgent(Agent):
         except ZeroDivisionError:
             pct_neg_rewards = 0
 
-        logging.debug(
-            'Gamma {}, Alpha {}, Epsilon {}, Rewards: {} : {} : {}'.format(
-                self.gamma, self.alpha, self.epsilon, self.total_reward,
-                pct_neg_rewards, int(self.reached_destination)))
+        # Trial log (smartcab.log)
+        if self.env.tracer.level >= INFO:
+            self.env.tracer.log(
+                'Gamma {}, Alpha {}, Epsilon {}, Rewards: {} : {} : {}'.format(
+                    self.gamma, self.alpha, self.epsilon, self.total_reward,
+                    pct_neg_rewards, int(self.reached_destination)))
 
         # Reset rewards
         self.num_total_rewards = 0
@@ -142,7 +197,12 @@ class LearningAgent(Agent):
 
         # Execute action and get reward
         reward = self.env.act(self, action)
-        self.states[self.state][action] += reward
+        if not self.learning:
+            pass
+        elif self.q_table is not None:
+            self.q_table.add(self.state, action, reward)
+        else:
+            self.states[self.state][action] += reward
 
         # Increment total reward
         self.total_reward += reward
@@ -152,8 +212,9 @@ class LearningAgent(Agent):
 
         if reward < 0:
             self.num_negative_rewards += 1
-            print('New infraction: ({}, {}): {}'.format(
-                self.state, action, reward))
+            if self.env.tracer.level >= DEBUG:
+                print('New infraction: ({}, {}): {}'.format(
+                    self.state_key(self.state), action, reward))
 
         # For final report
         self.reached_destination = self.env.done
@@ -165,15 +226,39 @@ class LearningAgent(Agent):
         inputs = self.env.sense(self)
         next_state = self.update_state(inputs, deadline, self.next_waypoint)
 
-        # Learn Q
-        self.states[self.state][action] += self.alpha * (
-            reward + self.gamma * max(self.states[next_state].values()) -
-            self.states[self.state][action])
+        # Learn Q (there is no next state once the destination is reached,
+        # i.e. no next_waypoint)
+        if not self.learning or self.next_waypoint is None:
+            pass
+        elif self.q_table is not None:
+            self.q_table.learn(self.state, action, reward, next_state,
+                               self.alpha, self.gamma)
+        else:
+            self.states[self.state][action] += self.alpha * (
+                reward + self.gamma * max(self.states[next_state].values()) -
+                self.states[self.state][action])
+
+        # Learn from replayed experience
+        if self.learning and self.replay is not None:
+            self.replay.add(self.state, self.q_table.action_index[action],
+                            reward, next_state)
+            self.learn_from_replay()
 
         # [debug]
-        print "LearningAgent.update(): deadline = {}, inputs = {}, " \
-              "action = {}, reward = {}".format(
-                deadline, inputs, action, reward)
+        if self.env.tracer.level >= DEBUG:
+            print "LearningAgent.update(): deadline = {}, inputs = {}, " \
+                  "action = {}, reward = {}".format(
+                    deadline, inputs, action, reward)
+
+    def learn_from_replay(self):
+        """Apply batched Q updates sampled from the replay buffer."""
+        if len(self.replay) < self.replay_batch_size:
+            return
+        for i in xrange(self.replay_updates):
+            states, actions, rewards, next_states = \
+                self.replay.sample(self.replay_batch_size)
+            self.q_table.learn_batch(states, actions, rewards, next_states,
+                                     self.alpha, self.gamma)
 
     # ------------------------------
     # THE FOLLOWING 2 FUNCTIONS ARE HERE FOR REFERENCE BUT ARE NOT BEING
@@ -231,10 +316,10 @@ class LearningAgent(Agent):
             action = self.follow_next_waypoint_directly_from_plan(
                 inputs, next_waypoint)
         else:
-            random_number = random.uniform(0, 1)
+            random_number = self.rng.uniform(0, 1)
             if random_number < self.epsilon:
                 # Explore: take random action
-                action = random.choice([None, 'forward', 'left', 'right'])
+                action = self.rng.choice([None, 'forward', 'left', 'right'])
             # Exploit
             else:
                 # Exploit: take action with maximum reward
@@ -243,8 +328,13 @@ class LearningAgent(Agent):
         return action
 
 
-def run():
-    """Run the agent for a finite number of trials."""
+def run(evaluate=False, fast_forward=False):
+    """Run the agent for a finite number of trials.
+
+    With evaluate=True, the learned policy is then scored with
+    Simulator.evaluate() (greedy, no learning). fast_forward=True runs the
+    trials headless without waiting on the clock.
+    """
 
     # Set up environment and agent
     e = Environment()  # create environment (also adds some dummy traffic)
@@ -256,13 +346,27 @@ def run():
     # Now simulate it
     # create simulator (uses pygame when display=True, if available)
     # NOTE: To speed up simulation, reduce update_delay and/or set
-    # display=False
-    sim = Simulator(e, update_delay=0.01, display=False)
+    # display=False. fast_forward=True skips the clock entirely (headless).
+    # Pass recorder=FrameRecorder() (recording.py) to log frames at full speed
+    # and watch them later with: python recording.py <file>.npz
+    sim = Simulator(e, update_delay=0.01, display=False,
+                    fast_forward=fast_forward)
 
     sim.run(n_trials=101)  # run for a specified number of trials
     # NOTE: To quit midway, press Esc or close pygame window,
     # or hit Ctrl+C on the command-line
 
+    # Score the learned policy (greedy, no learning) until the confidence
+    # intervals on success rate and net reward are narrow enough
+    if evaluate:
+        sim.evaluate()
+
 
 if __name__ == '__main__':
-    run()
+    parser = argparse.ArgumentParser(description='Train the smartcab agent.')
+    parser.add_argument('--evaluate', action='store_true',
+                        help='score the learned policy after training')
+    parser.add_argument('--fast-forward', action='store_true',
+                        help='step without waiting on the clock (headless)')
+    args = parser.parse_args()
+    run(evaluate=args.evaluate, fast_forward=args.fast_forward)
@@ -1,4 +1,7 @@
+import os
+import math
 import time
+import tempfile
 from collections import OrderedDict
 
 import numpy as np
@@ -6,15 +9,120 @@ import pandas as pd
 import matplotlib.pyplot as plt
 
 class Metric(object):
-    """Named sequence of x and y values, with optional plotting helpers."""
+    """Named sequence of x and y values, with optional plotting helpers.
 
-    def __init__(self, name):
+    Values are kept in preallocated arrays (x as integers, y as floats), and
+    running aggregates (count, mean, variance, min, max) plus a rolling
+    window are updated in O(1) per collect. With a spill_dir, every full
+    chunk is written to disk as an .npz file (columns x and y) and dropped
+    from memory, so xdata/ydata only hold the latest chunk; load() reads
+    the full history back. Each Metric spills into its own new
+    subdirectory of spill_dir, so metrics, runs and processes can share a
+    spill_dir, and reset() only removes the chunks this Metric wrote.
+    """
+
+    def __init__(self, name, window=10, chunk_size=1024, spill_dir=None):
         self.name = name
+        self.window = window
+        self.chunk_size = chunk_size
+        self.spill_dir = spill_dir
+        self.run_dir = None  # created in spill_dir on the first spill
+        self.chunk_files = []  # chunks written by this Metric, oldest first
         self.reset()
 
+    @property
+    def xdata(self):
+        return self._x[:self._n]
+
+    @property
+    def ydata(self):
+        return self._y[:self._n]
+
     def collect(self, x, y):
-        self.xdata.append(x)
-        self.ydata.append(y)
+        if self._n == len(self._y):
+            if self.spill_dir is not None:
+                self.spill()
+            else:
+                self._x = np.resize(self._x, 2 * len(self._x))
+                self._y = np.resize(self._y, 2 * len(self._y))
+        self._x[self._n] = x
+        self._y[self._n] = y
+        self._n += 1
+
+        # Running aggregates (Welford's algorithm for the variance)
+        self.count += 1
+        delta = y - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (y - self.mean)
+        self.min = min(self.min, y)
+        self.max = max(self.max, y)
+
+        # Rolling window
+        self._window_values[self._window_pos] = y
+        self._window_pos = (self._window_pos + 1) % self.window
+        self._window_size = min(self._window_size + 1, self.window)
+
+    @property
+    def variance(self):
+        return self._m2 / self.count if self.count > 0 else float('nan')
+
+    @property
+    def rolling_mean(self):
+        """Mean of the last window values."""
+        if self._window_size < self.window:
+            return self._window_values[:self._window_size].mean()
+        return self._window_values.mean()
+
+    def confidence_interval(self, confidence=0.95, proportion=False):
+        """(low, high) confidence interval of the mean, from the running aggregates.
+
+        Uses the normal approximation with the sample variance; for 0/1
+        values use proportion=True (Wilson score interval, which stays
+        meaningful when every value is the same).
+        """
+        n = self.count
+        if n < 2:
+            return float('-inf'), float('inf')
+        z = z_score(confidence)
+        if proportion:
+            p = self.mean
+            center = (p + z * z / (2 * n)) / (1 + z * z / n)
+            half_width = z * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n)) / (1 + z * z / n)
+        else:
+            center = self.mean
+            half_width = z * math.sqrt(self._m2 / (n - 1) / n)
+        return center - half_width, center + half_width
+
+    def stats(self):
+        return {'count': self.count, 'mean': self.mean, 'var': self.variance, 'std': np.sqrt(self.variance),
+                'min': self.min, 'max': self.max, 'rolling_mean': self.rolling_mean}
+
+    def spill(self):
+        """Write the in-memory chunk to disk and start a new one."""
+        if self._n == 0:
+            return
+        if self.run_dir is None:
+            if not os.path.isdir(self.spill_dir):
+                os.makedirs(self.spill_dir)
+            self.run_dir = tempfile.mkdtemp(prefix='{}-'.format(self.name), dir=self.spill_dir)
+        filename = os.path.join(self.run_dir, '{:06d}.npz'.format(len(self.chunk_files)))
+        np.savez(filename, x=self.xdata, y=self.ydata)
+        self.chunk_files.append(filename)
+        self._n = 0
+
+    def load(self):
+        """Full (x, y) history, including chunks spilled to disk."""
+        xs, ys = [], []
+        for filename in self.spilled_files():
+            with np.load(filename) as chunk:
+                xs.append(chunk['x'])
+                ys.append(chunk['y'])
+        xs.append(self.xdata.copy())
+        ys.append(self.ydata.copy())
+        return np.concatenate(xs), np.concatenate(ys)
+
+    def spilled_files(self):
+        return list(self.chunk_files)
 
     def plot(self, ax):
         self.plot_obj, = ax.plot(self.xdata, self.ydata, 'o-', label=self.name)
@@ -23,19 +131,51 @@ class Metric(object):
         self.plot_obj.set_data(self.xdata, self.ydata)
 
     def reset(self):
-        self.xdata = []
-        self.ydata = []
+        """Clear the metric, removing the chunks (and directory) it spilled."""
+        for filename in self.chunk_files:
+            os.remove(filename)
+        self.chunk_files = []
+        if self.run_dir is not None:
+            os.rmdir(self.run_dir)
+            self.run_dir = None
+        self._x = np.zeros(self.chunk_size, dtype=np.int64)
+        self._y = np.zeros(self.chunk_size)
+        self._n = 0
+
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+        self._window_values = np.zeros(self.window)
+        self._window_pos = 0
+        self._window_size = 0
+
+
+def z_score(confidence):
+    """Two-sided standard normal critical value, e.g. 1.96 for confidence=0.95."""
+    low, high = 0.0, 10.0
+    for i in xrange(60):  # bisection on the normal CDF
+        mid = (low + high) / 2
+        if math.erf(mid / math.sqrt(2)) < confidence:
+            low = mid
+        else:
+            high = mid
+    return (low + high) / 2
 
 
 class Reporter(object):
     """Collect metrics, analyze and report summary statistics."""
 
-    def __init__(self, metrics=[], live_plot=False):
+    def __init__(self, metrics=[], live_plot=False, window=10, spill_dir=None):
         self.metrics = OrderedDict()
         self.live_plot = live_plot
+        self.window = window  # size of the rolling window of each metric
+        self.spill_dir = spill_dir  # if set, metric chunks are spilled to disk here
 
         for name in metrics:
-            self.metrics[name] = Metric(name)
+            self.metrics[name] = Metric(name, window=self.window, spill_dir=self.spill_dir)
 
         if self.live_plot:
             if not plt.isinteractive():
@@ -46,7 +186,7 @@ class Reporter(object):
 
     def collect(self, name, x, y):
         if not name in self.metrics:
-            self.metrics[name] = Metric(name)
+            self.metrics[name] = Metric(name, window=self.window, spill_dir=self.spill_dir)
             if self.live_plot:
                 self.metrics[name].plot(self.ax)
                 self.ax.legend()  # add new metric to legend
@@ -83,7 +223,15 @@ class Reporter(object):
         plt.show()
 
     def summary(self):
-        return [pd.Series(metric.ydata, index=metric.xdata, name=name) for name, metric in self.metrics.iteritems()]
+        series = []
+        for name, metric in self.metrics.iteritems():
+            xdata, ydata = metric.load()
+            series.append(pd.Series(ydata, index=xdata, name=name))
+        return series
+
+    def stats(self):
+        """Running aggregates of every metric, without touching its history."""
+        return OrderedDict((name, metric.stats()) for name, metric in self.metrics.iteritems())
 
     def reset(self):
         for name in self.metrics:
@@ -0,0 +1,168 @@
+import sys
+import json
+import time
+import timeit
+import argparse
+import platform
+from collections import OrderedDict
+
+import numpy as np
+
+from environment import Environment
+from agent import LearningAgent
+from simulator import Simulator
+from tracing import Tracer, OFF
+
+timer = timeit.default_timer
+
+
+def make_env(num_dummies=3, seed=0, **agent_kwargs):
+    """Seeded, silent environment with a LearningAgent as primary agent."""
+    env = Environment(num_dummies=num_dummies, tracer=Tracer(level=OFF), seed=seed)
+    agent = env.create_agent(LearningAgent, **agent_kwargs)
+    env.set_primary_agent(agent, enforce_deadline=True)
+    env.reset()
+    return env, agent
+
+
+def best_of(func, repeat):
+    """Smallest wall time of repeat calls to func()."""
+    times = []
+    for i in xrange(repeat):
+        start = timer()
+        func()
+        times.append(timer() - start)
+    return min(times)
+
+
+def bench_env_step(n_steps=2000, repeat=5, **agent_kwargs):
+    """Microseconds per Environment.step() (all agents, lights and deadline)."""
+    env, agent = make_env(**agent_kwargs)
+
+    def steps():
+        for i in xrange(n_steps):
+            env.step()
+            if env.done:
+                env.reset()
+
+    return 1e6 * best_of(steps, repeat) / n_steps
+
+
+def bench_sense(num_dummies, n_calls=2000, repeat=5):
+    """Microseconds per (uncached) Environment.sense() of the primary agent."""
+    env, agent = make_env(num_dummies=num_dummies)
+
+    def calls():
+        for i in xrange(n_calls):
+            env.sense_cache.clear()  # time the computation, not a memoized lookup
+            env.sense(agent)
+
+    return 1e6 * best_of(calls, repeat) / n_calls
+
+
+def bench_agent_update(n_updates=2000, repeat=5, **agent_kwargs):
+    """Microseconds per LearningAgent.update() (sense, act and Q update).
+
+    Every update runs in a real tick: begin_step() updates the lights and
+    clears the sense cache, end_step() counts down the deadline and
+    advances the clock. Only update() itself is timed.
+    """
+    env, agent = make_env(num_dummies=0, **agent_kwargs)
+    times = []
+    for i in xrange(repeat):
+        elapsed = 0.0
+        for j in xrange(n_updates):
+            if env.done:
+                env.reset()
+            env.begin_step()
+            start = timer()
+            agent.update(env.t)
+            elapsed += timer() - start
+            env.end_step()
+        times.append(elapsed)
+    return 1e6 * min(times) / n_updates
+
+
+def bench_trials(n_trials=100, repeat=3, **agent_kwargs):
+    """Microseconds per trial of a headless fast-forward training run."""
+    times = []
+    for i in xrange(repeat):
+        env, agent = make_env(**agent_kwargs)
+        sim = Simulator(env, display=False, fast_forward=True)
+        sim.run(n_trials=n_trials)
+        times.append(1e6 / sim.run_stats['trials_per_sec'])
+    return min(times)
+
+
+def run_benchmarks(sense_dummies=(3, 30, 300, 3000), quick=False):
+    """Run the suite; returns an OrderedDict of benchmark name -> microseconds per op."""
+    scale = 0.1 if quick else 1.0
+    n = max(100, int(2000 * scale))
+    results = OrderedDict()
+    results['env_step'] = bench_env_step(n_steps=n)
+    results['env_step_array_q_table'] = bench_env_step(n_steps=n, array_q_table=True)
+    for num_dummies in sense_dummies:
+        results['sense_{}_dummies'.format(num_dummies)] = bench_sense(num_dummies, n_calls=n)
+    results['agent_update'] = bench_agent_update(n_updates=n)
+    results['agent_update_array_q_table'] = bench_agent_update(n_updates=n, array_q_table=True)
+    results['trial'] = bench_trials(n_trials=max(10, int(100 * scale)))
+    results['trial_array_q_table'] = bench_trials(n_trials=max(10, int(100 * scale)), array_q_table=True)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Benchmarks slower than baseline by more than threshold (fraction), as name -> ratio."""
+    regressions = OrderedDict()
+    for name, value in results.iteritems():
+        if name in baseline and baseline[name] > 0:
+            ratio = value / baseline[name]
+            if ratio > 1 + threshold:
+                regressions[name] = ratio
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the smartcab simulator (microseconds per op, lower is better).")
+    parser.add_argument('--output', help="write results to this JSON file")
+    parser.add_argument('--baseline', help="compare against results in this JSON file")
+    parser.add_argument('--threshold', type=float, default=0.20, help="allowed slowdown vs baseline (default: 0.20 = 20%%)")
+    parser.add_argument('--quick', action='store_true', help="fewer iterations (noisier)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(quick=args.quick)
+    report = OrderedDict([
+        ('meta', OrderedDict([
+            ('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S')),
+            ('python', platform.python_version()),
+            ('numpy', np.__version__),
+            ('platform', platform.platform()),
+            ('unit', 'microseconds per op')])),
+        ('results', results)])
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)['results']
+
+    print "{:<32} {:>12} {:>12} {:>8}".format('benchmark', 'us/op', 'baseline', 'ratio')
+    for name, value in results.iteritems():
+        if baseline is not None and name in baseline:
+            print "{:<32} {:>12.2f} {:>12.2f} {:>8.2f}".format(name, value, baseline[name], value / baseline[name])
+        else:
+            print "{:<32} {:>12.2f}".format(name, value)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.threshold)
+        for name, ratio in regressions.iteritems():
+            print "REGRESSION: {} is {:.0f}% slower than baseline".format(name, 100 * (ratio - 1))
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,17 +1,22 @@
 import time
 import random
+import bisect
 from collections import OrderedDict
 
+import numpy as np
+
+from rng import RandomStream
 from simulator import Simulator
+from tracing import Tracer, PhaseTimers, INFO, STEP, DEBUG
 
 class TrafficLight(object):
     """A traffic light that switches periodically."""
 
     valid_states = [True, False]  # True = NS open, False = EW open
 
-    def __init__(self, state=None, period=None):
-        self.state = state if state is not None else random.choice(self.valid_states)
-        self.period = period if period is not None else random.choice([3, 4, 5])
+    def __init__(self, state=None, period=None, rng=random):
+        self.state = state if state is not None else rng.choice(self.valid_states)
+        self.period = period if period is not None else rng.choice([3, 4, 5])
         self.last_updated = 0
 
     def reset(self):
@@ -23,6 +28,24 @@ class TrafficLight(object):
             self.last_updated = t
 
 
+class TrafficLightBank(object):
+    """Traffic lights of all intersections, held in arrays and switched in one operation."""
+
+    def __init__(self, n, rng=random):
+        lights = [TrafficLight(rng=rng) for i in xrange(n)]  # same random draws as one TrafficLight per intersection
+        self.state = np.array([light.state for light in lights], dtype=bool)  # True = NS open, False = EW open
+        self.period = np.array([light.period for light in lights], dtype=int)
+        self.last_updated = np.zeros(n, dtype=int)
+
+    def reset(self):
+        self.last_updated[:] = 0
+
+    def update(self, t):
+        switch = t - self.last_updated >= self.period
+        self.state ^= switch
+        self.last_updated[switch] = t
+
+
 class Environment(object):
     """Environment within which all agents operate."""
 
@@ -30,31 +53,58 @@ class Environment(object):
     valid_inputs = {'light': TrafficLight.valid_states, 'oncoming': valid_actions, 'left': valid_actions, 'right': valid_actions}
     valid_headings = [(1, 0), (0, -1), (-1, 0), (0, 1)]  # ENWS
     hard_time_limit = -100  # even if enforce_deadline is False, end trial when deadline reaches this value (to avoid deadlocks)
-
-    def __init__(self, num_dummies=3):
+    routing_cache_size = 16  # shortest-path routing tables kept per environment (see RoutePlanner)
+    min_trip_distance = 4  # reset() places start and destination at least this far apart (L1 distance)
+
+    @classmethod
+    def check_grid(cls, grid_size, block_size=1):
+        """Raise ValueError for a road network on which reset() cannot place a trip."""
+        cols, rows = grid_size
+        if cols < 1 or rows < 1 or (cols - 1) + (rows - 1) < cls.min_trip_distance:
+            raise ValueError("grid_size {} is too small: start and destination must be at least {} blocks apart".format(
+                tuple(grid_size), cls.min_trip_distance))
+        if block_size <= 0:
+            raise ValueError("block_size must be positive, got {}".format(block_size))
+
+    def __init__(self, num_dummies=3, tracer=None, grid_size=(8, 6), block_size=100, seed=None, timers=None):
+        self.check_grid(grid_size, block_size)
         self.num_dummies = num_dummies  # no. of dummy agents
+        self.tracer = tracer if tracer is not None else Tracer()
+        self.timers = timers if timers is not None else PhaseTimers()  # see set_timing()
+
+        # Random stream for lights, placement and dummy traffic (agents spawn their own from it);
+        # without a seed, one is drawn from the random module so random.seed() still applies
+        self.seed = seed if seed is not None else random.randint(0, 2 ** 31 - 1)
+        self.rng = RandomStream(self.seed)
 
         # Initialize simulation variables
         self.done = False
         self.t = 0
         self.agent_states = OrderedDict()
+        self.agent_order = {}  # agent -> creation index (its position in agent_states)
+        self.occupancy = {}  # intersection -> sorted list of (creation index, agent) located there
+        self.sense_cache = {}  # agent -> inputs sensed this tick (see sense())
         self.status_text = ""
 
         # Road network
-        self.grid_size = (8, 6)  # (cols, rows)
+        self.grid_size = grid_size  # (cols, rows)
         self.bounds = (1, 1, self.grid_size[0], self.grid_size[1])
-        self.block_size = 100
-        self.intersections = OrderedDict()
+        self.block_size = block_size
+        self.intersections = OrderedDict()  # intersection -> index into self.lights
         self.roads = []
         for x in xrange(self.bounds[0], self.bounds[2] + 1):
             for y in xrange(self.bounds[1], self.bounds[3] + 1):
-                self.intersections[(x, y)] = TrafficLight()  # a traffic light at each intersection
+                self.intersections[(x, y)] = len(self.intersections)
+        self.intersection_list = self.intersections.keys()  # for rng.choice(), built once
+        self.routing_tables = OrderedDict()  # destination -> RoutePlanner routing table, least recently used first
+        self.lights = TrafficLightBank(len(self.intersections), rng=self.rng)  # a traffic light at each intersection
 
+        # Roads connect intersections at L1 distance 1, in both directions
+        # (neighbours are visited in the same order as the intersections)
         for a in self.intersections:
-            for b in self.intersections:
-                if a == b:
-                    continue
-                if (abs(a[0] - b[0]) + abs(a[1] - b[1])) == 1:  # L1 distance = 1
+            for dx, dy in [(-1, 0), (0, -1), (0, 1), (1, 0)]:
+                b = (a[0] + dx, a[1] + dy)
+                if b in self.intersections:
                     self.roads.append((a, b))
 
         # Dummy agents
@@ -82,11 +132,38 @@ class Environment(object):
             'success': 0  # whether the agent reached the destination in time
         }
 
+        if self.timers.enabled:
+            self.set_timing(True)
+
     def create_agent(self, agent_class, *args, **kwargs):
         agent = agent_class(self, *args, **kwargs)
-        self.agent_states[agent] = {'location': random.choice(self.intersections.keys()), 'heading': (0, 1)}
+        self.agent_states[agent] = {'location': self.rng.choice(self.intersection_list), 'heading': (0, 1)}
+        self.agent_order[agent] = len(self.agent_order)
+        self.add_to_occupancy(agent, self.agent_states[agent]['location'])
+        if self.timers.enabled:
+            self.instrument_agent(agent, True)
         return agent
 
+    def set_timing(self, enabled=True):
+        """Switch the per-phase timers (self.timers) on or off."""
+        self.timers.enabled = enabled
+        for name in ['sense', 'act']:
+            if enabled:
+                self.timers.instrument(self, name, name)
+            else:
+                self.timers.uninstrument(self, name)
+        for agent in self.agent_states:
+            self.instrument_agent(agent, enabled)
+
+    def instrument_agent(self, agent, enabled):
+        planner = getattr(agent, 'planner', None)
+        if planner is None:
+            return
+        if enabled:
+            self.timers.instrument(planner, 'next_waypoint', 'planner')
+        else:
+            self.timers.uninstrument(planner, 'next_waypoint')
+
     def set_primary_agent(self, agent, enforce_deadline=False):
         self.primary_agent = agent
         self.enforce_deadline = enforce_deadline
@@ -94,31 +171,35 @@ class Environment(object):
     def reset(self):
         self.done = False
         self.t = 0
+        self.tracer.begin_trial()
 
         # Reset traffic lights
-        for traffic_light in self.intersections.itervalues():
-            traffic_light.reset()
+        self.lights.reset()
 
         # Pick a start and a destination
-        start = random.choice(self.intersections.keys())
-        destination = random.choice(self.intersections.keys())
+        start = self.rng.choice(self.intersection_list)
+        destination = self.rng.choice(self.intersection_list)
 
         # Ensure starting location and destination are not too close
-        while self.compute_dist(start, destination) < 4:
-            start = random.choice(self.intersections.keys())
-            destination = random.choice(self.intersections.keys())
+        while self.compute_dist(start, destination) < self.min_trip_distance:
+            start = self.rng.choice(self.intersection_list)
+            destination = self.rng.choice(self.intersection_list)
 
-        start_heading = random.choice(self.valid_headings)
+        start_heading = self.rng.choice(self.valid_headings)
         deadline = self.compute_dist(start, destination) * 5
-        print "Environment.reset(): Trial set up with start = {}, destination = {}, deadline = {}".format(start, destination, deadline)
+        if self.tracer.level >= INFO:
+            print "Environment.reset(): Trial set up with start = {}, destination = {}, deadline = {}".format(start, destination, deadline)
 
         # Initialize agent(s)
+        self.occupancy = {}
+        self.sense_cache.clear()
         for agent in self.agent_states.iterkeys():
             self.agent_states[agent] = {
-                'location': start if agent is self.primary_agent else random.choice(self.intersections.keys()),
-                'heading': start_heading if agent is self.primary_agent else random.choice(self.valid_headings),
+                'location': start if agent is self.primary_agent else self.rng.choice(self.intersection_list),
+                'heading': start_heading if agent is self.primary_agent else self.rng.choice(self.valid_headings),
                 'destination': destination if agent is self.primary_agent else None,
                 'deadline': deadline if agent is self.primary_agent else None}
+            self.add_to_occupancy(agent, self.agent_states[agent]['location'])
             agent.reset(destination=(destination if agent is self.primary_agent else None))
             if agent is self.primary_agent:
                 # Reset metrics for this trial (step data will be set during the step)
@@ -128,15 +209,43 @@ class Environment(object):
 
     def step(self):
         #print "Environment.step(): t = {}".format(self.t)  # [debug]
-
-        # Update traffic lights
-        for intersection, traffic_light in self.intersections.iteritems():
-            traffic_light.update(self.t)
-
-        # Update agents
-        for agent in self.agent_states.iterkeys():
+        if self.timers.enabled:
+            self.timed_step()
+            return
+        for agent in self.begin_step():
             agent.update(self.t)
-
+        self.end_step()
+
+    def timed_step(self):
+        """step(), accumulating the time of each phase in self.timers."""
+        timers = self.timers
+        start = last = timers.timer()
+        agents = self.begin_step()
+        now = timers.timer()
+        timers.add('lights', now - last)
+        last = now
+        for agent in agents:
+            agent.update(self.t)
+            now = timers.timer()
+            timers.add('primary_update' if agent is self.primary_agent else 'dummy_update', now - last)
+            last = now
+        self.end_step()
+        now = timers.timer()
+        timers.add('deadline', now - last)
+        timers.add('step', now - start)
+
+    def begin_step(self):
+        """Update traffic lights; returns the agents to update this step, in order.
+
+        step() is begin_step(), update() of each returned agent, end_step();
+        the split lets a driver pause at an agent's turn (see remote.py).
+        """
+        self.lights.update(self.t)
+        self.sense_cache.clear()  # lights changed
+        return self.agent_states.keys()
+
+    def end_step(self):
+        """Check the primary agent's deadline and advance time, after all agents were updated."""
         if self.done:
             return  # primary agent might have reached destination
 
@@ -144,28 +253,42 @@ class Environment(object):
             agent_deadline = self.agent_states[self.primary_agent]['deadline']
             if agent_deadline <= self.hard_time_limit:
                 self.done = True
-                print "Environment.step(): Primary agent hit hard time limit ({})! Trial aborted.".format(self.hard_time_limit)
+                if self.tracer.level >= INFO:
+                    print "Environment.step(): Primary agent hit hard time limit ({})! Trial aborted.".format(self.hard_time_limit)
             elif self.enforce_deadline and agent_deadline <= 0:
                 self.done = True
-                print "Environment.step(): Primary agent ran out of time! Trial aborted."
+                if self.tracer.level >= INFO:
+                    print "Environment.step(): Primary agent ran out of time! Trial aborted."
             self.agent_states[self.primary_agent]['deadline'] = agent_deadline - 1
 
         self.t += 1
 
     def sense(self, agent):
+        """Inputs of agent at its intersection (a shared dict; do not modify it).
+
+        Memoized per tick: lights only change in begin_step() and act() drops
+        the entries of every agent at the intersections a move leaves and
+        enters. This assumes an agent's next_waypoint only changes during its
+        own update(), around its act(), as for all agents here.
+        """
+        inputs = self.sense_cache.get(agent)
+        if inputs is not None:
+            return inputs
         assert agent in self.agent_states, "Unknown agent!"
 
         state = self.agent_states[agent]
         location = state['location']
         heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
+        light_state = self.lights.state[self.intersections[location]]
+        light = 'green' if (light_state and heading[1] != 0) or ((not light_state) and heading[0] != 0) else 'red'
 
         # Populate oncoming, left, right
         oncoming = None
         left = None
         right = None
-        for other_agent, other_state in self.agent_states.iteritems():
-            if agent == other_agent or location != other_state['location'] or (heading[0] == other_state['heading'][0] and heading[1] == other_state['heading'][1]):
+        for _, other_agent in self.occupancy[location]:  # only agents at the same intersection
+            other_state = self.agent_states[other_agent]
+            if agent == other_agent or (heading[0] == other_state['heading'][0] and heading[1] == other_state['heading'][1]):
                 continue
             other_heading = other_agent.get_next_waypoint()
             if (heading[0] * other_state['heading'][0] + heading[1] * other_state['heading'][1]) == -1:
@@ -178,7 +301,8 @@ class Environment(object):
                 if left != 'forward':  # we don't want to override left == 'forward'
                     left = other_heading
 
-        return {'light': light, 'oncoming': oncoming, 'left': left, 'right': right}
+        inputs = self.sense_cache[agent] = {'light': light, 'oncoming': oncoming, 'left': left, 'right': right}
+        return inputs
 
     def get_deadline(self, agent):
         return self.agent_states[agent]['deadline'] if agent is self.primary_agent else None
@@ -190,7 +314,8 @@ class Environment(object):
         state = self.agent_states[agent]
         location = state['location']
         heading = state['heading']
-        light = 'green' if (self.intersections[location].state and heading[1] != 0) or ((not self.intersections[location].state) and heading[0] != 0) else 'red'
+        light_state = self.lights.state[self.intersections[location]]
+        light = 'green' if (light_state and heading[1] != 0) or ((not light_state) and heading[0] != 0) else 'red'
         inputs = self.sense(agent)
 
         # Move agent if within bounds and obeys traffic rules
@@ -214,9 +339,12 @@ class Environment(object):
             # Valid move (could be null)
             if action is not None:
                 # Valid non-null move
-                location = ((location[0] + heading[0] - self.bounds[0]) % (self.bounds[2] - self.bounds[0] + 1) + self.bounds[0],
-                            (location[1] + heading[1] - self.bounds[1]) % (self.bounds[3] - self.bounds[1] + 1) + self.bounds[1])  # wrap-around
+                location = self.next_location(location, heading)
                 #if self.bounds[0] <= location[0] <= self.bounds[2] and self.bounds[1] <= location[1] <= self.bounds[3]:  # bounded
+                self.invalidate_sense(state['location'])
+                self.remove_from_occupancy(agent, state['location'])
+                self.add_to_occupancy(agent, location)
+                self.invalidate_sense(location)
                 state['location'] = location
                 state['heading'] = heading
                 reward = 2.0 if action == agent.get_next_waypoint() else -0.5  # valid, but is it correct? (as per waypoint)
@@ -233,7 +361,8 @@ class Environment(object):
                     reward += 10  # bonus
                     self.trial_data['success'] = 1
                 self.done = True
-                print "Environment.act(): Primary agent has reached destination!"  # [debug]
+                if self.tracer.level >= INFO:
+                    print "Environment.act(): Primary agent has reached destination!"  # [debug]
             self.status_text = "state: {}\naction: {}\nreward: {}".format(agent.get_state(), action, reward)
             #print "Environment.act() [POST]: location: {}, heading: {}, action: {}, reward: {}".format(location, heading, action, reward)  # [debug]
 
@@ -245,10 +374,30 @@ class Environment(object):
             self.step_data['action'] = action
             self.step_data['reward'] = reward
             self.trial_data['net_reward'] += reward
-            print "Environment.act(): Step data: {}".format(self.step_data)  # [debug]
+            if self.tracer.level >= STEP:
+                self.tracer.record_step(self.t, agent.get_state(), action, reward, state['deadline'])
+                if self.tracer.level >= DEBUG:
+                    print "Environment.act(): Step data: {}".format(self.step_data)  # [debug]
 
         return reward
 
+    def next_location(self, location, heading):
+        """Intersection reached by moving one block along heading (with wrap-around)."""
+        return ((location[0] + heading[0] - self.bounds[0]) % (self.bounds[2] - self.bounds[0] + 1) + self.bounds[0],
+                (location[1] + heading[1] - self.bounds[1]) % (self.bounds[3] - self.bounds[1] + 1) + self.bounds[1])  # wrap-around
+
+    def invalidate_sense(self, location):
+        """Drop memoized inputs of all agents at an intersection."""
+        for _, other_agent in self.occupancy.get(location, ()):
+            self.sense_cache.pop(other_agent, None)
+
+    def add_to_occupancy(self, agent, location):
+        """Index agent at an intersection, keeping agents in agent_states order."""
+        bisect.insort(self.occupancy.setdefault(location, []), (self.agent_order[agent], agent))
+
+    def remove_from_occupancy(self, agent, location):
+        self.occupancy[location].remove((self.agent_order[agent], agent))
+
     def compute_dist(self, a, b):
         """L1 distance between two points."""
         return abs(b[0] - a[0]) + abs(b[1] - a[1])
@@ -259,6 +408,7 @@ class Agent(object):
 
     def __init__(self, env):
         self.env = env
+        self.rng = env.rng.spawn()  # own random stream, independent of the environment's
         self.state = None
         self.next_waypoint = None
         self.color = 'cyan'
@@ -281,8 +431,9 @@ class DummyAgent(Agent):
 
     def __init__(self, env):
         super(DummyAgent, self).__init__(env)  # sets self.env = env, state = None, next_waypoint = None, and a default color
-        self.next_waypoint = random.choice(Environment.valid_actions[1:])
-        self.color = random.choice(self.color_choices)
+        # Dummy traffic draws from the environment's stream (it is part of the world)
+        self.next_waypoint = self.env.rng.choice(Environment.valid_actions[1:])
+        self.color = self.env.rng.choice(self.color_choices)
 
     def update(self, t):
         inputs = self.env.sense(self)
@@ -301,7 +452,7 @@ class DummyAgent(Agent):
         action = None
         if action_okay:
             action = self.next_waypoint
-            self.next_waypoint = random.choice(Environment.valid_actions[1:])
+            self.next_waypoint = self.env.rng.choice(Environment.valid_actions[1:])
         reward = self.env.act(self, action)
         #print "DummyAgent.update(): t = {}, inputs = {}, action = {}, reward = {}".format(t, inputs, action, reward)  # [debug]
         #print "DummyAgent.update(): next_waypoint = {}".format(self.next_waypoint)  # [debug]
@@ -1,20 +1,48 @@
-import random
+from collections import deque
+
+from tracing import DEBUG
 
 class RoutePlanner(object):
-    """Silly route planner that is meant for a perpendicular grid network."""
+    """Silly route planner that is meant for a perpendicular grid network.
+
+    With shortest_path=True, next_waypoint() looks up a precomputed table of
+    true shortest-path waypoints instead (see build_routing_table()). Tables
+    are cached in env.routing_tables, shared by every planner of the
+    environment and limited to the env.routing_cache_size most recently
+    used destinations.
+    """
 
-    def __init__(self, env, agent):
+    def __init__(self, env, agent, shortest_path=False):
         self.env = env
         self.agent = agent
         self.destination = None
+        self.shortest_path = shortest_path
+        self.routing_table = None
 
     def route_to(self, destination=None):
-        self.destination = destination if destination is not None else random.choice(self.env.intersections.keys())
-        print "RoutePlanner.route_to(): destination = {}".format(destination)  # [debug]
+        self.destination = destination if destination is not None else self.agent.rng.choice(self.env.intersection_list)
+        if self.env.tracer.level >= DEBUG:
+            print "RoutePlanner.route_to(): destination = {}".format(destination)  # [debug]
+        if self.shortest_path:
+            self.routing_table = self.get_routing_table(self.destination)
+
+    def get_routing_table(self, destination):
+        """Routing table to destination from the environment's LRU cache, built on a miss."""
+        tables = self.env.routing_tables
+        if destination in tables:
+            routing_table = tables.pop(destination)  # re-inserted below as most recently used
+        else:
+            routing_table = self.build_routing_table(destination)
+            if len(tables) >= self.env.routing_cache_size:
+                tables.popitem(last=False)  # least recently used
+        tables[destination] = routing_table
+        return routing_table
 
     def next_waypoint(self):
         location = self.env.agent_states[self.agent]['location']
         heading = self.env.agent_states[self.agent]['heading']
+        if self.shortest_path:
+            return self.routing_table[(location, heading)]
         delta = (self.destination[0] - location[0], self.destination[1] - location[1])
         if delta[0] == 0 and delta[1] == 0:
             return None
@@ -36,3 +64,41 @@ class RoutePlanner(object):
                 return 'right'
             else:
                 return 'left'
+
+    def build_routing_table(self, destination):
+        """Map every (location, heading) to the first move of a shortest route to destination.
+
+        Runs a breadth-first search backwards from the destination over
+        (location, heading) states, moving as Environment.act() does
+        (including wrap-around). Ties prefer forward, then right, then left.
+        """
+        headings = self.env.valid_headings
+        distance = {}
+        queue = deque()
+        for heading in headings:
+            distance[(destination, heading)] = 0
+            queue.append((destination, heading))
+
+        while queue:
+            location, heading = queue.popleft()
+            d = distance[(location, heading)]
+            # States that reach (location, heading) in one move: the agent came
+            # from one block back along heading, facing heading (forward) or
+            # facing the direction it turned from (left/right)
+            previous = self.env.next_location(location, (-heading[0], -heading[1]))
+            for previous_heading in [heading, (-heading[1], heading[0]), (heading[1], -heading[0])]:
+                state = (previous, previous_heading)
+                if state not in distance:
+                    distance[state] = d + 1
+                    queue.append(state)
+
+        routing_table = {}
+        for location in self.env.intersections:
+            for heading in headings:
+                if location == destination:
+                    routing_table[(location, heading)] = None
+                    continue
+                moves = [('forward', heading), ('right', (-heading[1], heading[0])), ('left', (heading[1], -heading[0]))]
+                routing_table[(location, heading)] = min(
+                    moves, key=lambda move: distance[(self.env.next_location(location, move[1]), move[1])])[0]
+        return routing_table
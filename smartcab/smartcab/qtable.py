@@ -0,0 +1,179 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+LIGHT = ['red', 'green']
+VALID_ACTIONS = [None, 'forward', 'left', 'right']
+HURRY_UP = ['yes', 'no']
+POSSIBLE_WAYPOINTS = ['forward', 'left', 'right']
+
+
+class StateEncoder(object):
+    """Maps (light, oncoming, left, hurry_up, waypoint) to a compact integer.
+
+    Same state space as LearningAgent.generate_states_dict_with_empty_rewards(),
+    enumerated in the same order, without building strings.
+    """
+
+    fields = [LIGHT, VALID_ACTIONS, VALID_ACTIONS, HURRY_UP, POSSIBLE_WAYPOINTS]
+
+    def __init__(self):
+        self.codes = [dict((value, i) for i, value in enumerate(values)) for values in self.fields]
+        self.strides = []
+        stride = 1
+        for values in reversed(self.fields):
+            self.strides.insert(0, stride)
+            stride *= len(values)
+        self.n_states = stride
+
+    def encode(self, light, oncoming, left, hurry_up, waypoint):
+        """Integer state, or None for a state without a waypoint (destination reached)."""
+        codes = self.codes
+        strides = self.strides
+        waypoint_code = codes[4].get(waypoint)
+        if waypoint_code is None:
+            return None
+        return (codes[0][light] * strides[0] + codes[1][oncoming] * strides[1] +
+                codes[2][left] * strides[2] + codes[3][hurry_up] * strides[3] + waypoint_code)
+
+    def decode(self, state):
+        """(light, oncoming, left, hurry_up, waypoint) for an integer state."""
+        values = []
+        for field, stride in zip(self.fields, self.strides):
+            values.append(field[(state // stride) % len(field)])
+        return tuple(values)
+
+    def key(self, state):
+        """String key used by the dict-backed Q-table for an integer state."""
+        return '-'.join(str(value) for value in self.decode(state))
+
+
+def snapshot_filename(filename):
+    """Snapshot file name with the .npy extension that np.save() adds when it is missing."""
+    if isinstance(filename, basestring) and not filename.endswith('.npy'):
+        return filename + '.npy'
+    return filename
+
+
+class QTable(object):
+    """Q-values in a 2-D array indexed by (encoded state, action)."""
+
+    def __init__(self, encoder=None, values=None, actions=None):
+        self.encoder = encoder if encoder is not None else StateEncoder()
+
+        # Column order follows the iteration order of a per-state dict built
+        # like generate_states_dict_with_empty_rewards(), so argmax breaks ties
+        # exactly as max(states[state], key=states[state].get) does.
+        if actions is None:
+            rewards = {}
+            for valid_action in VALID_ACTIONS:
+                rewards[valid_action] = 0
+            actions = list(rewards)
+        self.actions = actions
+        self.action_index = dict((action, i) for i, action in enumerate(self.actions))
+
+        if values is None:
+            values = np.zeros((self.encoder.n_states, len(self.actions)))
+        elif values.shape != (self.encoder.n_states, len(self.actions)):
+            raise ValueError("Q-values of shape {} do not match {} states x {} actions".format(
+                values.shape, self.encoder.n_states, len(self.actions)))
+        self.values = values
+
+    # Per-step lookups and updates work on Python scalars (item/itemset and a
+    # row converted with tolist()), which is faster than NumPy scalar indexing
+    # on a 4-element row; the array is kept for storage, snapshots and batches.
+
+    def best_action(self, state):
+        row = self.values[state].tolist()
+        return self.actions[row.index(max(row))]  # first maximum, like argmax()
+
+    def max_value(self, state):
+        return max(self.values[state].tolist())
+
+    def add(self, state, action, value):
+        a = self.action_index[action]
+        self.values.itemset(state, a, self.values.item(state, a) + value)
+
+    def learn(self, state, action, reward, next_state, alpha, gamma):
+        """One Q-learning update, in the same order of operations as LearningAgent.update()."""
+        a = self.action_index[action]
+        q = self.values.item(state, a)
+        self.values.itemset(state, a, q + alpha * (reward + gamma * max(self.values[next_state].tolist()) - q))
+
+    def learn_batch(self, states, actions, rewards, next_states, alpha, gamma):
+        """Q-learning updates for a batch of transitions in one vectorized step.
+
+        actions are column indices and next_states of -1 mark terminal
+        transitions (no bootstrapped value). Deltas are computed from the
+        values before the batch; repeated (state, action) pairs accumulate.
+        """
+        terminal = next_states < 0
+        next_values = np.where(terminal, 0.0, self.values[np.where(terminal, 0, next_states)].max(axis=1))
+        deltas = alpha * (rewards + gamma * next_values - self.values[states, actions])
+        np.add.at(self.values, (states, actions), deltas)
+
+    def save(self, filename):
+        """Write a snapshot as a .npy file that load() can memory-map.
+
+        Each row is one state; the record fields are named after the actions,
+        so the column order travels with the snapshot. A name without the
+        .npy extension gets it, here and in load(), so both take the same name.
+        """
+        dtype = np.dtype([(str(action), self.values.dtype) for action in self.actions])
+        np.save(snapshot_filename(filename), np.ascontiguousarray(self.values).view(dtype).reshape(-1))
+
+    @classmethod
+    def load(cls, filename, mmap_mode='r'):
+        """Q-table backed by a snapshot written by save().
+
+        mmap_mode='r' shares the file read-only between processes, 'c' gives
+        a private copy-on-write view (for training from a warm start) and
+        None reads it fully into memory.
+        """
+        snapshot = np.load(snapshot_filename(filename), mmap_mode=mmap_mode)
+        actions = [None if name == 'None' else name for name in snapshot.dtype.names]
+        # Plain ndarray view of the mapped buffer (avoids np.memmap overhead per lookup)
+        values = np.asarray(snapshot).view(snapshot.dtype[0]).reshape(len(snapshot), len(actions))
+        return cls(values=values, actions=actions)
+
+    @classmethod
+    def from_dict(cls, states):
+        """Q-table with the values of a dict in the format of LearningAgent.states."""
+        q_table = cls()
+        for state in xrange(q_table.encoder.n_states):
+            rewards = states[q_table.encoder.key(state)]
+            for action, i in q_table.action_index.iteritems():
+                q_table.values[state, i] = rewards[action]
+        return q_table
+
+    def to_dict(self):
+        """Nested dict in the format of LearningAgent.states."""
+        states = {}
+        for state in xrange(self.encoder.n_states):
+            states[self.encoder.key(state)] = dict(zip(self.actions, self.values[state].tolist()))
+        return states
+
+
+def test_snapshot_round_trip():
+    """save() and load() with the same name, with and without the .npy extension."""
+    q_table = QTable()
+    q_table.values[:] = np.random.random(q_table.values.shape)
+    directory = tempfile.mkdtemp()
+    try:
+        for name in ['checkpoint', 'checkpoint.npy']:
+            filename = os.path.join(directory, name)
+            q_table.save(filename)
+            for mmap_mode in ['r', 'c', None]:
+                loaded = QTable.load(filename, mmap_mode=mmap_mode)
+                assert loaded.actions == q_table.actions
+                assert (loaded.values == q_table.values).all()
+        assert sorted(os.listdir(directory)) == ['checkpoint.npy']
+    finally:
+        shutil.rmtree(directory)
+    print "test_snapshot_round_trip(): OK"
+
+
+if __name__ == '__main__':
+    test_snapshot_round_trip()
@@ -0,0 +1,184 @@
+import sys
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+from simulator import Simulator
+
+WAYPOINTS = [None, 'forward', 'left', 'right']  # waypoint codes (index)
+
+
+class FrameRecorder(object):
+    """Compact per-step log of everything Simulator.render() draws.
+
+    Attach to a Simulator (recorder=...) to record one frame after each
+    reset and each step, at headless speed: agent locations, headings,
+    destinations and next waypoints, traffic light states and the status
+    text. Frames are kept in preallocated arrays that double when full;
+    save() writes them, with the road network and agent colors, to a
+    compressed .npz file for the Player.
+    """
+
+    def __init__(self, capacity=1024):
+        self.capacity = capacity
+        self.n_frames = 0
+        self.trial = -1
+        self.env = None
+
+    def start(self, env):
+        """Record the static layout of env and allocate frame storage."""
+        self.env = env
+        self.agents = list(env.agent_states)
+        self.waypoint_codes = dict((waypoint, i) for i, waypoint in enumerate(WAYPOINTS))
+        n_agents = len(self.agents)
+        n_lights = len(env.intersections)
+        self.frames = OrderedDict([
+            ('trial', np.zeros(self.capacity, dtype=np.int32)),
+            ('t', np.zeros(self.capacity, dtype=np.int32)),
+            ('location', np.zeros((self.capacity, n_agents, 2), dtype=np.int16)),
+            ('heading', np.zeros((self.capacity, n_agents, 2), dtype=np.int8)),
+            ('destination', np.zeros((self.capacity, n_agents, 2), dtype=np.int16)),  # (0, 0) if none
+            ('waypoint', np.zeros((self.capacity, n_agents), dtype=np.int8)),  # index into WAYPOINTS
+            ('lights', np.zeros((self.capacity, n_lights), dtype=bool))
+        ])
+        self.status_text = []
+
+    def begin_trial(self, env):
+        if self.env is not env:
+            self.start(env)
+        self.trial += 1
+        self.record(env)
+
+    def record(self, env):
+        if self.n_frames == len(self.frames['t']):
+            for name, values in self.frames.iteritems():
+                self.frames[name] = np.resize(values, (2 * len(values),) + values.shape[1:])
+        i = self.n_frames
+        frames = self.frames
+        frames['trial'][i] = self.trial
+        frames['t'][i] = env.t
+        for j, agent in enumerate(self.agents):
+            state = env.agent_states[agent]
+            frames['location'][i, j] = state['location']
+            frames['heading'][i, j] = state['heading']
+            frames['destination'][i, j] = state['destination'] if state['destination'] is not None else (0, 0)
+            frames['waypoint'][i, j] = self.waypoint_codes.get(agent.get_next_waypoint(), 0)
+        frames['lights'][i] = env.lights.state
+        self.status_text.append(env.status_text)
+        self.n_frames += 1
+
+    def save(self, filename):
+        """Write recorded frames to a compressed .npz file (read back with load_recording())."""
+        arrays = dict((name, values[:self.n_frames]) for name, values in self.frames.iteritems())
+        np.savez_compressed(filename,
+                            grid_size=np.array(self.env.grid_size),
+                            block_size=np.array(self.env.block_size),
+                            intersections=np.array(self.env.intersections.keys(), dtype=np.int16),  # in light index order
+                            roads=np.array(self.env.roads, dtype=np.int16),
+                            colors=np.array([agent.color for agent in self.agents]),
+                            status_text=np.array(self.status_text),
+                            **arrays)
+
+
+def load_recording(filename):
+    """Recording written by FrameRecorder.save(), as a dict of arrays."""
+    with np.load(filename) as data:
+        return dict((name, data[name]) for name in data.files)
+
+
+class RecordedAgent(object):
+    """Stand-in for an agent during playback (what Simulator.render() reads)."""
+
+    def __init__(self, color):
+        self.color = color
+        self.next_waypoint = None
+
+    def get_next_waypoint(self):
+        return self.next_waypoint
+
+
+class RecordedLights(object):
+    def __init__(self, n):
+        self.state = np.zeros(n, dtype=bool)
+
+
+class PlaybackEnvironment(object):
+    """Stand-in for Environment, set to the state of one recorded frame at a time."""
+
+    def __init__(self, recording):
+        self.recording = recording
+        self.grid_size = tuple(recording['grid_size'])
+        self.block_size = int(recording['block_size'])
+        self.intersections = OrderedDict((tuple(xy), i) for i, xy in enumerate(recording['intersections'].tolist()))
+        self.roads = [(tuple(a), tuple(b)) for a, b in recording['roads'].tolist()]
+        self.lights = RecordedLights(len(self.intersections))
+        self.agent_states = OrderedDict((RecordedAgent(color), {}) for color in recording['colors'])
+        self.status_text = ""
+        self.n_frames = len(recording['t'])
+
+    def show(self, i):
+        """Set the environment to frame i."""
+        recording = self.recording
+        for j, (agent, state) in enumerate(self.agent_states.iteritems()):
+            state['location'] = tuple(recording['location'][i, j].tolist())
+            state['heading'] = tuple(recording['heading'][i, j].tolist())
+            destination = tuple(recording['destination'][i, j].tolist())
+            state['destination'] = destination if destination != (0, 0) else None
+            agent.next_waypoint = WAYPOINTS[recording['waypoint'][i, j]]
+        self.lights.state[:] = recording['lights'][i]
+        self.status_text = str(recording['status_text'][i])
+
+
+class Player(object):
+    """Replays a recording through Simulator.render(), on screen or to image files."""
+
+    def __init__(self, recording, update_delay=0.1):
+        self.env = PlaybackEnvironment(recording)
+        self.sim = Simulator(self.env, update_delay=update_delay, display=True)
+
+    def play(self, start=0, stop=None, output=None):
+        """Render frames [start, stop).
+
+        With output (a format string such as 'frames/{:06d}.png'), each
+        frame is saved as an image instead of waiting update_delay between
+        frames; assemble them into a video with e.g. ffmpeg.
+        """
+        if not self.sim.display:
+            return
+        sim = self.sim
+        pygame = sim.pygame
+        trials = self.env.recording['trial']
+        stop = stop if stop is not None else self.env.n_frames
+        for i in xrange(start, stop):
+            if i == start or trials[i] != trials[i - 1]:
+                sim.drawn_light_state = None  # new trial: redraw the whole screen
+            self.env.show(i)
+            sim.render()
+            if output is not None:
+                pygame.image.save(sim.screen, output.format(i))
+                continue
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == 27):  # Esc
+                    pygame.display.quit()
+                    return
+            pygame.time.wait(sim.frame_delay)
+        pygame.display.quit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Play back a smartcab recording.")
+    parser.add_argument('recording', help=".npz file written by FrameRecorder.save()")
+    parser.add_argument('--delay', type=float, default=0.1, help="seconds between frames (default: 0.1)")
+    parser.add_argument('--start', type=int, default=0, help="first frame")
+    parser.add_argument('--stop', type=int, help="stop before this frame")
+    parser.add_argument('--output', help="save frames as images, e.g. 'frames/{:06d}.png'")
+    args = parser.parse_args(argv)
+
+    player = Player(load_recording(args.recording), update_delay=args.delay)
+    player.play(start=args.start, stop=args.stop, output=args.output)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
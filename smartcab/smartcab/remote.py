@@ -0,0 +1,288 @@
+import json
+import time
+import threading
+import multiprocessing
+from multiprocessing.connection import Listener, Client
+
+import numpy as np
+
+from environment import Agent, Environment
+from planner import RoutePlanner
+from tracing import Tracer, OFF
+
+# Request opcodes (first byte of each message)
+CREATE, RESET, SENSE, ACT, STEP, CLOSE = range(6)
+OK, ERROR = 0, 1  # reply status (first byte of each reply)
+
+# One record per environment in every RESET/SENSE/STEP reply: what the
+# primary agent senses at its turn of the coming step, plus the outcome of
+# the last step. Actions and inputs are indices into Environment.valid_actions.
+RECORD_DTYPE = np.dtype([
+    ('light', np.uint8),  # 1 = green
+    ('oncoming', np.int8),
+    ('left', np.int8),
+    ('right', np.int8),
+    ('waypoint', np.int8),
+    ('deadline', np.int16),
+    ('reward', np.float32),  # reward of the last step (0 after reset)
+    ('done', np.uint8)
+])
+ACTION_DTYPE = np.int8
+
+ACTION_CODES = dict((action, i) for i, action in enumerate(Environment.valid_actions))
+
+
+class RemoteAgent(Agent):
+    """Primary agent whose actions are chosen by a remote client."""
+
+    def __init__(self, env):
+        super(RemoteAgent, self).__init__(env)  # sets self.env = env, state = None, next_waypoint = None, and a default color
+        self.color = 'red'  # override color
+        self.planner = RoutePlanner(self.env, self)  # simple route planner to get next_waypoint
+        self.action = None  # set by the server before the agent's turn
+        self.inputs = None
+        self.reward = 0.0
+
+    def reset(self, destination=None):
+        self.planner.route_to(destination)
+        self.action = None
+        self.reward = 0.0
+
+    def observe(self):
+        """Waypoint and inputs at the start of the agent's turn."""
+        self.next_waypoint = self.planner.next_waypoint()
+        self.inputs = self.env.sense(self)
+        return self.inputs
+
+    def update(self, t):
+        # Same order as LearningAgent.update(), with the inputs from observe()
+        self.reward = self.env.act(self, self.action)
+        self.next_waypoint = self.planner.next_waypoint()
+
+
+class EnvironmentBatch(object):
+    """Environments with a RemoteAgent each, stepped up to the primary agent's turn.
+
+    Between requests every environment that is not done is paused inside
+    its step, right before the primary agent's update, so the observations
+    sent to the client are exactly what the agent senses when it acts.
+    """
+
+    def __init__(self, n_envs, num_dummies=3, seed=0, enforce_deadline=True, grid_size=(8, 6)):
+        self.envs = []
+        self.agents = []
+        for i in xrange(n_envs):
+            env = Environment(num_dummies=num_dummies, tracer=Tracer(level=OFF), grid_size=tuple(grid_size), seed=seed + i)
+            agent = env.create_agent(RemoteAgent)
+            env.set_primary_agent(agent, enforce_deadline=enforce_deadline)
+            self.envs.append(env)
+            self.agents.append(agent)
+        self.pending = [None] * n_envs  # agents still to update after the primary agent, per environment
+        self.records = np.zeros(n_envs, dtype=RECORD_DTYPE)
+        self.records['done'] = 1  # until reset
+
+    def reset(self, mask=None):
+        if mask is not None and len(mask) != len(self.envs):
+            raise ValueError("mask has {} entries for {} environments".format(len(mask), len(self.envs)))
+        for i, env in enumerate(self.envs):
+            if mask is None or mask[i]:
+                env.reset()
+                self.records[i]['reward'] = 0.0
+                self.begin_turn(i)
+
+    def begin_turn(self, i):
+        """Step environment i up to its primary agent's turn and record the observation."""
+        env = self.envs[i]
+        agent = self.agents[i]
+        agents = env.begin_step()
+        turn = agents.index(agent)
+        for other_agent in agents[:turn]:
+            other_agent.update(env.t)
+        self.pending[i] = agents[turn + 1:]
+
+        inputs = agent.observe()
+        record = self.records[i]
+        record['light'] = inputs['light'] == 'green'
+        record['oncoming'] = ACTION_CODES[inputs['oncoming']]
+        record['left'] = ACTION_CODES[inputs['left']]
+        record['right'] = ACTION_CODES[inputs['right']]
+        record['waypoint'] = ACTION_CODES[agent.next_waypoint]
+        record['deadline'] = env.get_deadline(agent)
+        record['done'] = env.done
+
+    def act(self, actions):
+        """Set every primary agent's next action; actions are checked before any is set."""
+        actions = np.asarray(actions)
+        if len(actions) != len(self.envs):
+            raise ValueError("{} actions for {} environments".format(len(actions), len(self.envs)))
+        if len(actions) and (actions.min() < 0 or actions.max() >= len(Environment.valid_actions)):
+            raise ValueError("action codes must be in [0, {})".format(len(Environment.valid_actions)))
+        for agent, action in zip(self.agents, actions):
+            agent.action = Environment.valid_actions[action]
+
+    def step(self):
+        """Finish the paused step of every environment that is not done and begin the next one."""
+        for i, env in enumerate(self.envs):
+            record = self.records[i]
+            if record['done']:
+                record['reward'] = 0.0
+                continue
+            agent = self.agents[i]
+            agent.update(env.t)
+            for other_agent in self.pending[i]:
+                other_agent.update(env.t)
+            env.end_step()
+            record['reward'] = agent.reward
+            if env.done:
+                record['done'] = 1
+            else:
+                self.begin_turn(i)
+
+
+class SimulationServer(object):
+    """Hosts batches of environments for remote clients.
+
+    Listens on a multiprocessing.connection address (a Unix socket path, a
+    (host, port) pair or a Windows named pipe); each client connection gets
+    its own EnvironmentBatch, served in its own thread. Requests and
+    replies are single messages: an opcode byte followed by packed
+    RECORD_DTYPE/ACTION_DTYPE arrays, so one round trip steps every
+    environment of a batch.
+    """
+
+    def __init__(self, address, family=None, authkey=None):
+        self.listener = Listener(address, family=family, authkey=authkey)
+        self.address = self.listener.address
+
+    def serve_forever(self):
+        while True:
+            conn = self.listener.accept()
+            thread = threading.Thread(target=self.handle, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def handle(self, conn):
+        batch = None
+        try:
+            while True:
+                try:
+                    message = conn.recv_bytes()
+                except EOFError:
+                    break
+                op, payload = ord(message[0]), message[1:]
+                try:
+                    if op == CREATE:
+                        batch = EnvironmentBatch(**json.loads(payload))
+                        reply = ''
+                    elif op == CLOSE:
+                        break
+                    elif batch is None:
+                        raise ValueError("no environments (send CREATE first)")
+                    elif op == RESET:
+                        batch.reset(np.frombuffer(payload, dtype=np.uint8) if payload else None)
+                        reply = batch.records.tobytes()
+                    elif op == SENSE:
+                        reply = batch.records.tobytes()
+                    elif op == ACT:
+                        batch.act(np.frombuffer(payload, dtype=ACTION_DTYPE))
+                        reply = ''
+                    elif op == STEP:
+                        if payload:
+                            batch.act(np.frombuffer(payload, dtype=ACTION_DTYPE))
+                        batch.step()
+                        reply = batch.records.tobytes()
+                    else:
+                        raise ValueError("unknown opcode {}".format(op))
+                except Exception as e:
+                    conn.send_bytes(chr(ERROR) + "{}: {}".format(e.__class__.__name__, e))
+                    continue
+                conn.send_bytes(chr(OK) + reply)
+        finally:
+            conn.close()
+
+    def close(self):
+        self.listener.close()
+
+
+class SimulationClient(object):
+    """Drives a batch of environments hosted by a SimulationServer.
+
+    reset(), sense() and step() return a RECORD_DTYPE array with one record
+    per environment; actions are arrays of indices into
+    Environment.valid_actions.
+    """
+
+    def __init__(self, address, n_envs, family=None, authkey=None, **config):
+        self.conn = Client(address, family=family, authkey=authkey)
+        self.n_envs = n_envs
+        config['n_envs'] = n_envs
+        self.request(CREATE, json.dumps(config))
+
+    def request(self, op, payload=''):
+        self.conn.send_bytes(chr(op) + payload)
+        reply = self.conn.recv_bytes()
+        if ord(reply[0]) == ERROR:
+            raise RuntimeError("SimulationServer: {}".format(reply[1:]))
+        return reply[1:]
+
+    def records(self, reply):
+        return np.frombuffer(reply, dtype=RECORD_DTYPE)
+
+    def reset(self, mask=None):
+        """Start new trials in the environments selected by a boolean mask (default: all)."""
+        payload = np.asarray(mask, dtype=np.uint8).tobytes() if mask is not None else ''
+        return self.records(self.request(RESET, payload))
+
+    def sense(self):
+        return self.records(self.request(SENSE))
+
+    def act(self, actions):
+        """Set the primary agents' next actions without stepping."""
+        self.request(ACT, np.asarray(actions, dtype=ACTION_DTYPE).tobytes())
+
+    def step(self, actions=None):
+        """Act (if actions are given) and advance every environment that is not done by one step."""
+        payload = np.asarray(actions, dtype=ACTION_DTYPE).tobytes() if actions is not None else ''
+        return self.records(self.request(STEP, payload))
+
+    def close(self):
+        self.conn.send_bytes(chr(CLOSE))
+        self.conn.close()
+
+
+def serve(address, family=None, authkey=None):
+    SimulationServer(address, family=family, authkey=authkey).serve_forever()
+
+
+def run():
+    """Start a server process and drive a batch of environments with a waypoint-following policy."""
+
+    address = ('localhost', 0)
+    server = SimulationServer(address)
+    process = multiprocessing.Process(target=server.serve_forever)
+    process.daemon = True
+    process.start()
+    server.close()  # the server process has its own copy of the listener
+
+    n_envs = 256
+    n_trials = 10
+    client = SimulationClient(server.address, n_envs, seed=0, enforce_deadline=True)
+    n_steps = 0
+    start_time = time.time()
+    net_reward = np.zeros(n_envs)
+    for trial in xrange(n_trials):
+        records = client.reset()
+        while not records['done'].all():
+            n_steps += (records['done'] == 0).sum()
+            records = client.step(records['waypoint'])  # follow the planner
+            net_reward += records['reward']
+    elapsed = time.time() - start_time
+    client.close()
+    process.terminate()
+
+    print "remote.run(): {} environments x {} trials, {} steps in {:.3f} secs ({:.1f} steps/sec); mean net reward per trial: {:.2f}".format(
+        n_envs, n_trials, n_steps, elapsed, n_steps / elapsed, net_reward.mean() / n_trials)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class ReplayBuffer(object):
+    """Fixed-capacity ring buffer of (state, action, reward, next_state) transitions.
+
+    States are StateEncoder codes and actions are Q-table column indices;
+    next_state is -1 for terminal transitions (destination reached). Once
+    full, the oldest transitions are overwritten.
+    """
+
+    def __init__(self, capacity=10000, random_state=None):
+        self.capacity = capacity
+        self.random_state = random_state if random_state is not None else np.random
+
+        self.states = np.zeros(capacity, dtype=np.int32)
+        self.actions = np.zeros(capacity, dtype=np.int8)
+        self.rewards = np.zeros(capacity)
+        self.next_states = np.zeros(capacity, dtype=np.int32)
+        self.size = 0
+        self.head = 0
+
+    def __len__(self):
+        return self.size
+
+    def add(self, state, action, reward, next_state):
+        i = self.head
+        self.states[i] = state
+        self.actions[i] = action
+        self.rewards[i] = reward
+        self.next_states[i] = next_state if next_state is not None else -1
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def sample(self, batch_size):
+        """Uniformly sampled batch (with replacement) as (states, actions, rewards, next_states)."""
+        idx = self.random_state.randint(0, self.size, size=batch_size)
+        return self.states[idx], self.actions[idx], self.rewards[idx], self.next_states[idx]
+
+    def clear(self):
+        self.size = 0
+        self.head = 0
@@ -0,0 +1,45 @@
+import numpy as np
+
+
+class RandomStream(object):
+    """Independently seeded random stream that draws uniforms in NumPy blocks.
+
+    Uniforms are generated block_size at a time by a private
+    np.random.RandomState and handed out one by one from a buffer.
+    choice() and uniform() use one uniform per call, with the same formulas
+    as Python 2.7's random module, so code written against the random
+    module can use a stream instead.
+
+    A stream is identified by its key (a seed or a tuple of seeds);
+    spawn() derives child streams keyed (key..., n) that do not draw from
+    this stream, so every environment and agent gets its own stream and
+    results are reproducible per seed in any process.
+    """
+
+    def __init__(self, seed=0, block_size=256):
+        self.key = tuple(seed) if isinstance(seed, (tuple, list)) else (seed,)
+        self.block_size = block_size
+        self.random_state = np.random.RandomState(list(self.key))
+        self.n_spawned = 0
+        self.buffer = []
+        self.pos = 0
+
+    def random(self):
+        """Next uniform in [0, 1)."""
+        if self.pos == len(self.buffer):
+            self.buffer = self.random_state.random_sample(self.block_size).tolist()  # floats are faster to index than an array
+            self.pos = 0
+        u = self.buffer[self.pos]
+        self.pos += 1
+        return u
+
+    def choice(self, seq):
+        return seq[int(self.random() * len(seq))]
+
+    def uniform(self, a, b):
+        return a + (b - a) * self.random()
+
+    def spawn(self):
+        """New child stream, independent of this one and of the other children."""
+        self.n_spawned += 1
+        return RandomStream(self.key + (self.n_spawned,), block_size=self.block_size)
@@ -3,9 +3,8 @@ import time
 import random
 import importlib
 
-import numpy as np
-
 from analysis import Reporter
+from tracing import INFO
 
 class Simulator(object):
     """Simulates agents in a dynamic smartcab environment.
@@ -25,8 +24,17 @@ class Simulator(object):
         'orange'  : (255, 128,   0)
     }
 
-    def __init__(self, env, size=None, update_delay=1.0, display=True, live_plot=False):
+    # Rotation of the agent sprite (facing East) for each heading
+    sprite_angles = {
+        ( 1,  0):   0,
+        (-1,  0): 180,
+        ( 0,  1): -90,
+        ( 0, -1):  90
+    }
+
+    def __init__(self, env, size=None, update_delay=1.0, display=True, live_plot=False, fast_forward=False, recorder=None, spill_dir=None):
         self.env = env
+        self.recorder = recorder  # e.g. recording.FrameRecorder, gets a frame after each reset and step
         self.size = size if size is not None else ((self.env.grid_size[0] + 1) * self.env.block_size, (self.env.grid_size[1] + 1) * self.env.block_size)
         self.width, self.height = self.size
         
@@ -40,7 +48,11 @@ class Simulator(object):
         self.last_updated = 0.0
         self.update_delay = update_delay  # duration between each step (in secs)
 
-        self.display = display
+        # Fast-forward: step back-to-back without polling the clock (headless only)
+        self.fast_forward = fast_forward
+        self.run_stats = {'n_trials': 0, 'n_steps': 0, 'elapsed': 0.0, 'steps_per_sec': 0.0, 'trials_per_sec': 0.0}
+
+        self.display = display and not self.fast_forward
         if self.display:
             try:
                 self.pygame = importlib.import_module('pygame')
@@ -53,9 +65,19 @@ class Simulator(object):
                 for agent in self.env.agent_states:
                     agent._sprite = self.pygame.transform.smoothscale(self.pygame.image.load(os.path.join("images", "car-{}.png".format(agent.color))), self.agent_sprite_size)
                     agent._sprite_size = (agent._sprite.get_width(), agent._sprite.get_height())
+                    # Pre-rotated sprites, one per heading (the image faces East)
+                    agent._sprites = {heading: self.pygame.transform.rotate(agent._sprite, angle) for heading, angle in self.sprite_angles.iteritems()}
 
                 self.font = self.pygame.font.Font(None, 28)
+                self.text_cache = {}  # (text, color) -> rendered surface
                 self.paused = False
+
+                # Static layer (background, roads, intersections) is drawn once; each frame
+                # only the regions covered by dynamic elements and changed lights are redrawn
+                self.static_layer = None
+                self.light_positions = None  # light index -> pixel position of its intersection
+                self.drawn_light_state = None  # light states currently on screen
+                self.dirty_rects = []  # regions covered by dynamic elements in the last frame
             except ImportError as e:
                 self.display = False
                 print "Simulator.__init__(): Unable to import pygame; display disabled.\n{}: {}".format(e.__class__.__name__, e)
@@ -65,18 +87,29 @@ class Simulator(object):
 
         # Setup metrics to report
         self.live_plot = live_plot
-        self.rep = Reporter(metrics=['net_reward', 'avg_net_reward', 'final_deadline', 'success'], live_plot=self.live_plot)
         self.avg_net_reward_window = 10
+        self.spill_dir = spill_dir  # if set, metric history is spilled to disk here in chunks (bounded memory)
+        self.rep = Reporter(metrics=['net_reward', 'avg_net_reward', 'final_deadline', 'success'], live_plot=self.live_plot, window=self.avg_net_reward_window, spill_dir=self.spill_dir)
+        self.eval_rep = None  # metrics of the last evaluate()
+        self.timer_totals = {}  # env.timers totals at the end of the last collected trial
 
     def run(self, n_trials=1):
         self.quit = False
         self.rep.reset()
+        if self.fast_forward:
+            self.run_fast_forward(n_trials)
+            return
+
         for trial in xrange(n_trials):
-            print "Simulator.run(): Trial {}".format(trial)  # [debug]
+            if self.env.tracer.level >= INFO:
+                print "Simulator.run(): Trial {}".format(trial)  # [debug]
             self.env.reset()
+            if self.recorder is not None:
+                self.recorder.begin_trial(self.env)
             self.current_time = 0.0
             self.last_updated = 0.0
             self.start_time = time.time()
+            self.drawn_light_state = None  # redraw the whole screen on the first frame
             while True:
                 try:
                     # Update current time
@@ -100,7 +133,8 @@ class Simulator(object):
                     # Update environment
                     if self.current_time - self.last_updated >= self.update_delay:
                         self.env.step()
-                        # TODO: Log step data
+                        if self.recorder is not None:
+                            self.recorder.record(self.env)
                         self.last_updated = self.current_time
 
                     # Render GUI and sleep
@@ -116,13 +150,9 @@ class Simulator(object):
             if self.quit:
                 break
 
-            # Collect/update metrics
-            self.rep.collect('net_reward', trial, self.env.trial_data['net_reward'])  # total reward obtained in this trial
-            self.rep.collect('avg_net_reward', trial, np.mean(self.rep.metrics['net_reward'].ydata[-self.avg_net_reward_window:]))  # rolling mean of reward
-            self.rep.collect('final_deadline', trial, self.env.trial_data['final_deadline'])  # final deadline value (time remaining)
-            self.rep.collect('success', trial, self.env.trial_data['success'])
-            if self.live_plot:
-                self.rep.refresh_plot()  # autoscales axes, draws stuff and flushes events
+            self.collect_metrics(trial)
+
+        self.env.tracer.flush()
 
         # Report final metrics
         if self.display:
@@ -132,56 +162,228 @@ class Simulator(object):
         if self.live_plot:
             self.rep.show_plot()  # holds till user closes plot window
 
+    def run_fast_forward(self, n_trials=1, until=None, rep=None):
+        """Run trials headless, calling env.step() back-to-back with no clock polling.
+
+        until, if given, is called after each trial's metrics are collected;
+        the run stops early when it returns True. Metrics go to rep
+        (default: self.rep).
+        """
+        rep = rep if rep is not None else self.rep
+        n_steps = 0
+        n_completed = 0
+        start_time = time.time()
+        for trial in xrange(n_trials):
+            if self.env.tracer.level >= INFO:
+                print "Simulator.run(): Trial {}".format(trial)  # [debug]
+            self.env.reset()
+            if self.recorder is not None:
+                self.recorder.begin_trial(self.env)
+            while True:
+                try:
+                    n_steps += 1
+                    self.env.step()
+                    if self.recorder is not None:
+                        self.recorder.record(self.env)
+                except KeyboardInterrupt:
+                    self.quit = True
+                finally:
+                    # Same exit semantics as run(): end the trial once the environment is done
+                    if self.quit or self.env.done:
+                        break
+
+            if self.quit:
+                break
+
+            self.collect_metrics(trial, rep)
+            n_completed += 1
+            if until is not None and until():
+                break
+
+        self.env.tracer.flush()
+
+        # Report throughput
+        elapsed = time.time() - start_time
+        self.run_stats = {
+            'n_trials': n_completed,
+            'n_steps': n_steps,
+            'elapsed': elapsed,
+            'steps_per_sec': n_steps / elapsed if elapsed > 0 else float('inf'),
+            'trials_per_sec': n_completed / elapsed if elapsed > 0 else float('inf')
+        }
+        if self.env.tracer.level >= INFO:
+            print "Simulator.run_fast_forward(): {n_trials} trials, {n_steps} steps in {elapsed:.3f} secs ({steps_per_sec:.1f} steps/sec, {trials_per_sec:.1f} trials/sec)".format(**self.run_stats)
+
+        if self.live_plot and rep is self.rep:
+            self.rep.show_plot()  # holds till user closes plot window
+
+    def evaluate(self, max_trials=10000, min_trials=30, success_width=0.10, reward_width=2.0, confidence=0.95):
+        """Score the primary agent's current policy, with learning switched off.
+
+        Runs headless trials (as run_fast_forward()) with agent.learning =
+        False, so the Q-table is frozen and actions are greedy, until the
+        confidence intervals of the success rate and of the mean net reward
+        are narrower than success_width and reward_width (after at least
+        min_trials), or max_trials are done. The evaluation trials are
+        collected in their own Reporter, self.eval_rep, so the training
+        metrics in self.rep are kept. Returns a summary dict.
+        """
+        agent = self.env.primary_agent
+        self.eval_rep = Reporter(metrics=['net_reward', 'avg_net_reward', 'final_deadline', 'success'], window=self.avg_net_reward_window, spill_dir=self.spill_dir)
+        metrics = self.eval_rep.metrics
+
+        def intervals():
+            return (metrics['success'].confidence_interval(confidence, proportion=True),
+                    metrics['net_reward'].confidence_interval(confidence))
+
+        def converged():
+            if metrics['success'].count < min_trials:
+                return False
+            success_ci, reward_ci = intervals()
+            return success_ci[1] - success_ci[0] <= success_width and reward_ci[1] - reward_ci[0] <= reward_width
+
+        learning = agent.learning
+        agent.learning = False
+        self.quit = False
+        try:
+            self.run_fast_forward(max_trials, until=converged, rep=self.eval_rep)
+        finally:
+            agent.learning = learning
+
+        success_ci, reward_ci = intervals()
+        report = {
+            'n_trials': metrics['success'].count,
+            'converged': converged(),
+            'confidence': confidence,
+            'success_rate': metrics['success'].mean,
+            'success_ci': success_ci,
+            'net_reward': metrics['net_reward'].mean,
+            'net_reward_ci': reward_ci,
+            'elapsed': self.run_stats['elapsed']
+        }
+        if self.env.tracer.level >= INFO:
+            print "Simulator.evaluate(): {n_trials} trials in {elapsed:.3f} secs (converged: {converged}); success rate {success_rate:.3f} [{success_ci[0]:.3f}, {success_ci[1]:.3f}], net reward {net_reward:.2f} [{net_reward_ci[0]:.2f}, {net_reward_ci[1]:.2f}] ({confidence:.0%} CI)".format(**report)
+        return report
+
+    def collect_metrics(self, trial, rep=None):
+        rep = rep if rep is not None else self.rep
+        rep.collect('net_reward', trial, self.env.trial_data['net_reward'])  # total reward obtained in this trial
+        rep.collect('avg_net_reward', trial, rep.metrics['net_reward'].rolling_mean)  # rolling mean of reward
+        rep.collect('final_deadline', trial, self.env.trial_data['final_deadline'])  # final deadline value (time remaining)
+        rep.collect('success', trial, self.env.trial_data['success'])
+        if self.env.timers.enabled:
+            # Time spent in each phase during this trial (secs), as metrics time_<phase>
+            for phase, total in self.env.timers.totals.iteritems():
+                rep.collect('time_' + phase, trial, total - self.timer_totals.get(phase, 0.0))
+            self.timer_totals = dict(self.env.timers.totals)
+        if self.live_plot and rep is self.rep:
+            self.rep.refresh_plot()  # autoscales axes, draws stuff and flushes events
+
+    def build_static_layer(self):
+        """Draw background, roads and intersections (without lights) to an off-screen surface."""
+        self.static_layer = self.pygame.Surface(self.size).convert()
+        self.static_layer.fill(self.bg_color)
+        for road in self.env.roads:
+            self.pygame.draw.line(self.static_layer, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
+
+        self.light_positions = [None] * len(self.env.intersections)
+        for intersection, light_index in self.env.intersections.iteritems():
+            pos = (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size)
+            self.pygame.draw.circle(self.static_layer, self.road_color, pos, 10)
+            self.light_positions[light_index] = pos
+
+    def light_rect(self, light_index):
+        """Screen region covered by a traffic light (intersection circle and signal bar)."""
+        pos = self.light_positions[light_index]
+        return self.pygame.Rect(pos[0] - 18, pos[1] - 18, 36, 36)
+
+    def lights_under(self, rect):
+        """Indices of the traffic lights whose light_rect() overlaps rect."""
+        bs = self.env.block_size
+        lights = []
+        for x in xrange((rect.left - 18) // bs, (rect.right + 18) // bs + 1):
+            for y in xrange((rect.top - 18) // bs, (rect.bottom + 18) // bs + 1):
+                light_index = self.env.intersections.get((x, y))
+                if light_index is not None and self.light_rect(light_index).colliderect(rect):
+                    lights.append(light_index)
+        return lights
+
+    def draw_light(self, light_index):
+        pos = self.light_positions[light_index]
+        if self.env.lights.state[light_index]:  # North-South is open
+            self.pygame.draw.line(self.screen, self.colors['green'], (pos[0], pos[1] - 15), (pos[0], pos[1] + 15), self.road_width)
+        else:  # East-West is open
+            self.pygame.draw.line(self.screen, self.colors['green'], (pos[0] - 15, pos[1]), (pos[0] + 15, pos[1]), self.road_width)
+
+    def render_text(self, text, color):
+        """Rendered text surface, cached per (text, color)."""
+        key = (text, color)
+        surface = self.text_cache.get(key)
+        if surface is None:
+            if len(self.text_cache) >= 256:
+                self.text_cache.clear()  # status text changes every step; keep the cache bounded
+            surface = self.text_cache[key] = self.font.render(text, True, color, self.bg_color)
+        return surface
+
     def render(self):
-        # Clear screen
-        self.screen.fill(self.bg_color)
+        if self.static_layer is None:
+            self.build_static_layer()
+
+        # Erase: restore the static layer under last frame's dynamic elements and changed lights
+        light_state = self.env.lights.state
+        if self.drawn_light_state is None:
+            # Full redraw
+            self.screen.blit(self.static_layer, (0, 0))
+            erased = [self.screen.get_rect()]
+            redraw_lights = range(len(self.light_positions))
+        else:
+            erased = self.dirty_rects
+            erased.extend(self.light_rect(i) for i in (light_state != self.drawn_light_state).nonzero()[0])
+            for rect in erased:
+                self.screen.blit(self.static_layer, rect, rect)
+            # Lights that changed or were (partly) covered by an erased region
+            redraw_lights = set()
+            for rect in erased:
+                redraw_lights.update(self.lights_under(rect))
+        self.drawn_light_state = light_state.copy()
 
         # Draw elements
-        # * Static elements
-        for road in self.env.roads:
-            self.pygame.draw.line(self.screen, self.road_color, (road[0][0] * self.env.block_size, road[0][1] * self.env.block_size), (road[1][0] * self.env.block_size, road[1][1] * self.env.block_size), self.road_width)
-
-        for intersection, traffic_light in self.env.intersections.iteritems():
-            self.pygame.draw.circle(self.screen, self.road_color, (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size), 10)
-            if traffic_light.state:  # North-South is open
-                self.pygame.draw.line(self.screen, self.colors['green'],
-                    (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size - 15),
-                    (intersection[0] * self.env.block_size, intersection[1] * self.env.block_size + 15), self.road_width)
-            else:  # East-West is open
-                self.pygame.draw.line(self.screen, self.colors['green'],
-                    (intersection[0] * self.env.block_size - 15, intersection[1] * self.env.block_size),
-                    (intersection[0] * self.env.block_size + 15, intersection[1] * self.env.block_size), self.road_width)
+        # * Traffic lights
+        for light_index in redraw_lights:
+            self.draw_light(light_index)
 
         # * Dynamic elements
+        drawn = []
         for agent, state in self.env.agent_states.iteritems():
             # Compute precise agent location here (back from the intersection some)
             agent_offset = (2 * state['heading'][0] * self.agent_circle_radius, 2 * state['heading'][1] * self.agent_circle_radius)
             agent_pos = (state['location'][0] * self.env.block_size - agent_offset[0], state['location'][1] * self.env.block_size - agent_offset[1])
             agent_color = self.colors[agent.color]
-            if hasattr(agent, '_sprite') and agent._sprite is not None:
-                # Draw agent sprite (image), properly rotated
-                rotated_sprite = agent._sprite if state['heading'] == (1, 0) else self.pygame.transform.rotate(agent._sprite, 180 if state['heading'][0] == -1 else state['heading'][1] * -90)
-                self.screen.blit(rotated_sprite,
+            if hasattr(agent, '_sprites') and agent._sprites is not None:
+                # Draw agent sprite (image), pre-rotated for its heading
+                rotated_sprite = agent._sprites[state['heading']]
+                drawn.append(self.screen.blit(rotated_sprite,
                     self.pygame.rect.Rect(agent_pos[0] - agent._sprite_size[0] / 2, agent_pos[1] - agent._sprite_size[1] / 2,
-                        agent._sprite_size[0], agent._sprite_size[1]))
+                        agent._sprite_size[0], agent._sprite_size[1])))
             else:
                 # Draw simple agent (circle with a short line segment poking out to indicate heading)
-                self.pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius)
-                self.pygame.draw.line(self.screen, agent_color, agent_pos, state['location'], self.road_width)
+                drawn.append(self.pygame.draw.circle(self.screen, agent_color, agent_pos, self.agent_circle_radius))
+                drawn.append(self.pygame.draw.line(self.screen, agent_color, agent_pos, state['location'], self.road_width))
             if agent.get_next_waypoint() is not None:
-                self.screen.blit(self.font.render(agent.get_next_waypoint(), True, agent_color, self.bg_color), (agent_pos[0] + 10, agent_pos[1] + 10))
+                drawn.append(self.screen.blit(self.render_text(agent.get_next_waypoint(), agent_color), (agent_pos[0] + 10, agent_pos[1] + 10)))
             if state['destination'] is not None:
-                self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 6)
-                self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 15, 2)
+                drawn.append(self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 6))
+                drawn.append(self.pygame.draw.circle(self.screen, agent_color, (state['destination'][0] * self.env.block_size, state['destination'][1] * self.env.block_size), 15, 2))
 
         # * Overlays
         text_y = 10
         for text in self.env.status_text.split('\n'):
-            self.screen.blit(self.font.render(text, True, self.colors['red'], self.bg_color), (100, text_y))
+            drawn.append(self.screen.blit(self.render_text(text, self.colors['red']), (100, text_y)))
             text_y += 20
 
-        # Flip buffers
-        self.pygame.display.flip()
+        # Update only the regions that changed
+        self.pygame.display.update(erased + drawn)
+        self.dirty_rects = drawn
 
     def pause(self):
         abs_pause_time = time.time()
@@ -194,5 +396,6 @@ class Simulator(object):
                 if event.type == self.pygame.KEYDOWN:
                     self.paused = False
             self.pygame.time.wait(self.frame_delay)
-        self.screen.blit(self.font.render(pause_text, True, self.bg_color, self.bg_color), (100, self.height - 40))
+        # Restore what was under the pause text on the next frame
+        self.dirty_rects.append(self.font.render(pause_text, True, self.colors['cyan'], self.bg_color).get_rect(topleft=(100, self.height - 40)))
         self.start_time += (time.time() - abs_pause_time)
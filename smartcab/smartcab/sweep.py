@@ -0,0 +1,73 @@
+import itertools
+import multiprocessing
+
+import pandas as pd
+
+from environment import Environment
+from agent import LearningAgent
+from simulator import Simulator
+from tracing import Tracer, OFF, INFO
+
+# Reporter metrics collected from every configuration
+SWEEP_METRICS = ['net_reward', 'success', 'final_deadline']
+
+
+def parameter_grid(gamma=(0.75,), alpha=(0.30,), epsilon=(0.10,), n_trials=(101,), seed=(0,)):
+    """All combinations of the given parameter values, as a list of config dicts."""
+    names = ['gamma', 'alpha', 'epsilon', 'n_trials', 'seed']
+    return [dict(zip(names, values)) for values in itertools.product(gamma, alpha, epsilon, n_trials, seed)]
+
+
+def run_config(config, quiet=True):
+    """Train a LearningAgent with one configuration; returns one row per trial."""
+    e = Environment(tracer=Tracer(level=OFF if quiet else INFO), seed=config['seed'])  # same results in any worker
+    a = e.create_agent(LearningAgent, gamma=config['gamma'], alpha=config['alpha'], epsilon=config['epsilon'])
+    e.set_primary_agent(a, enforce_deadline=True)
+    sim = Simulator(e, display=False, fast_forward=True)
+    sim.run(n_trials=config['n_trials'])
+
+    metrics = sim.rep.metrics
+    rows = []
+    for i, trial in enumerate(metrics['net_reward'].xdata):
+        row = dict(config, trial=trial)
+        for name in SWEEP_METRICS:
+            row[name] = metrics[name].ydata[i]
+        rows.append(row)
+    return rows
+
+
+def sweep(configs, processes=None):
+    """Run each configuration in a worker process and collect all trials into one DataFrame."""
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        results = pool.map(run_config, configs, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    columns = ['gamma', 'alpha', 'epsilon', 'n_trials', 'seed', 'trial'] + SWEEP_METRICS
+    return pd.DataFrame([row for rows in results for row in rows], columns=columns)
+
+
+def summarize(results, last_n_trials=10):
+    """Mean metrics per configuration over its last last_n_trials trials."""
+    config_columns = ['gamma', 'alpha', 'epsilon', 'n_trials', 'seed']
+    last_trials = results[results['trial'] >= results['n_trials'] - last_n_trials]
+    return last_trials.groupby(config_columns)[SWEEP_METRICS].mean().reset_index()
+
+
+def run():
+    """Sweep gamma/alpha/epsilon over a small grid and print a summary."""
+
+    configs = parameter_grid(
+        gamma=[0.25, 0.50, 0.75],
+        alpha=[0.10, 0.30, 0.50],
+        epsilon=[0.05, 0.10],
+        n_trials=[101],
+        seed=[0, 1])
+    results = sweep(configs)
+    print summarize(results).sort_values('net_reward', ascending=False).to_string(index=False)
+
+
+if __name__ == '__main__':
+    run()
@@ -0,0 +1,177 @@
+import os
+import logging
+import timeit
+from collections import OrderedDict
+
+import numpy as np
+
+from qtable import StateEncoder, VALID_ACTIONS
+
+# Trace levels; call sites check tracer.level before formatting anything
+OFF = 0  # no output
+INFO = 1  # per-trial console messages and trial log (default)
+STEP = 2  # also record step events into the ring buffer
+DEBUG = 3  # also print per-step debug messages
+
+# One record per step of the primary agent
+STEP_DTYPE = np.dtype([
+    ('trial', np.int32),
+    ('t', np.int32),
+    ('state', np.int16),  # StateEncoder code (-1 if unknown)
+    ('action', np.int8),  # index into Environment.valid_actions
+    ('reward', np.float32),
+    ('deadline', np.int32)
+])
+
+
+# State keys of the dict-backed Q-table -> integer codes, built on first use
+state_codes = {}
+
+# Trial log loggers by absolute log file path (see trial_logger())
+trial_loggers = {}
+
+
+def trial_logger(log_filename):
+    """Logger that writes to log_filename.
+
+    There is one logger (and one open file) per log file, shared by every
+    Tracer that logs to it, so creating environments does not leak handlers.
+    """
+    path = os.path.abspath(log_filename)
+    if path not in trial_loggers:
+        logger = logging.Logger('smartcab', logging.DEBUG)
+        logger.addHandler(logging.FileHandler(path))
+        trial_loggers[path] = logger
+    return trial_loggers[path]
+
+
+class Tracer(object):
+    """Leveled tracing for the smartcab world.
+
+    Step events are kept in a fixed-size ring buffer of STEP_DTYPE records,
+    allocated when the first one is recorded (nothing is allocated for
+    tracers that never record steps, e.g. below STEP).
+    With a filename, the buffer is appended to that file as raw binary
+    records whenever it fills up and on flush(); read it back with
+    load_trace(). Without a filename, the oldest events are overwritten.
+    """
+
+    def __init__(self, level=INFO, capacity=4096, filename=None, log_filename='smartcab.log'):
+        self.level = level
+        self.capacity = capacity
+        self.filename = filename
+        self.log_filename = log_filename
+        self.logger = None
+
+        self.buffer = None  # allocated by the first record_step()
+        self.size = 0  # number of valid records in the buffer
+        self.head = 0  # next position to write
+        self.trial = -1
+
+        self.action_codes = dict((action, i) for i, action in enumerate(VALID_ACTIONS))
+
+        if self.filename is not None:
+            open(self.filename, 'wb').close()  # start a fresh trace file
+
+    def begin_trial(self):
+        self.trial += 1
+
+    def record_step(self, t, state, action, reward, deadline):
+        if self.buffer is None:
+            self.buffer = np.zeros(self.capacity, dtype=STEP_DTYPE)
+        if self.size == self.capacity and self.filename is not None:
+            self.flush()
+        record = self.buffer[self.head]
+        record['trial'] = self.trial
+        record['t'] = t
+        record['state'] = state if isinstance(state, (int, long)) else self.state_code(state)
+        record['action'] = self.action_codes[action]
+        record['reward'] = reward
+        record['deadline'] = deadline if deadline is not None else 0
+        self.head = (self.head + 1) % self.capacity
+        self.size = min(self.size + 1, self.capacity)
+
+    def state_code(self, key):
+        """Integer code of a dict Q-table state key (-1 if unknown)."""
+        if not state_codes:
+            encoder = StateEncoder()
+            state_codes.update((encoder.key(state), state) for state in xrange(encoder.n_states))
+        return state_codes.get(key, -1)
+
+    def events(self):
+        """Buffered step events, oldest first."""
+        if self.buffer is None:
+            return np.zeros(0, dtype=STEP_DTYPE)
+        start = (self.head - self.size) % self.capacity
+        return np.roll(self.buffer, -start)[:self.size].copy()
+
+    def flush(self):
+        """Append buffered step events to the trace file and empty the buffer."""
+        if self.filename is None or self.size == 0:
+            return
+        with open(self.filename, 'ab') as f:
+            self.events().tofile(f)
+        self.size = 0
+        self.head = 0
+
+    def log(self, message):
+        """Write a message to the trial log file."""
+        if self.logger is None:
+            self.logger = trial_logger(self.log_filename)
+        self.logger.debug(message)
+
+
+class PhaseTimers(object):
+    """Call counts and accumulated wall time per named phase.
+
+    Environment.set_timing() switches them on: step() is then timed per
+    phase (lights, dummy_update, primary_update, deadline and the whole
+    step), and sense, act and the agents' planner lookups are wrapped with
+    timed versions. Times are inclusive (act includes the sense it calls).
+    Switched off, the wrappers are removed and nothing is timed.
+    """
+
+    timer = staticmethod(timeit.default_timer)
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.reset()
+
+    def reset(self):
+        self.calls = OrderedDict()
+        self.totals = OrderedDict()
+
+    def add(self, phase, elapsed):
+        if phase in self.totals:
+            self.calls[phase] += 1
+            self.totals[phase] += elapsed
+        else:
+            self.calls[phase] = 1
+            self.totals[phase] = elapsed
+
+    def instrument(self, obj, method_name, phase):
+        """Time every call of obj.method_name() as phase (shadows the method on the instance)."""
+        method = getattr(type(obj), method_name).__get__(obj)
+        timer = self.timer
+
+        def timed(*args, **kwargs):
+            start = timer()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.add(phase, timer() - start)
+
+        setattr(obj, method_name, timed)
+
+    def uninstrument(self, obj, method_name):
+        obj.__dict__.pop(method_name, None)
+
+    def stats(self):
+        """Per phase: number of calls, total and mean time (secs)."""
+        return OrderedDict((phase, {'calls': self.calls[phase], 'total': total, 'mean': total / self.calls[phase]})
+                           for phase, total in self.totals.iteritems())
+
+
+def load_trace(filename):
+    """Step events written by Tracer.flush(), as a structured array."""
+    return np.fromfile(filename, dtype=STEP_DTYPE)
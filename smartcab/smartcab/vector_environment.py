@@ -0,0 +1,309 @@
+import time
+import random
+
+import numpy as np
+
+from environment import Environment, TrafficLight, DummyAgent
+from rng import RandomStream
+
+# Action/input codes: index into Environment.valid_actions
+NONE, FORWARD, LEFT, RIGHT = range(len(Environment.valid_actions))
+
+
+class VectorEnvironment(object):
+    """N independent smartcab worlds stepped in lockstep.
+
+    Each world holds the same road network, traffic lights, dummy agents and
+    primary agent as Environment, but all of them are kept in NumPy arrays
+    (one row per world) and advanced with a single call to step().
+
+    Agents are updated in the same order as Environment.agent_states (dummies
+    first, primary agent last) and follow the same sense()/act() rules. Every
+    world draws the uniforms of RandomStream(seeds[i]), in the same order as
+    the scalar Environment does, so world i reproduces the trials of
+    Environment(seed=seeds[i]) (whose agents draw from their own streams).
+
+    Actions and sensed inputs are encoded as indices into
+    Environment.valid_actions (NONE, FORWARD, LEFT, RIGHT).
+    """
+
+    rand_block_size = 256  # uniforms pre-drawn per world and handed out from a buffer
+
+    def __init__(self, n_worlds, num_dummies=3, seed=None, enforce_deadline=False, grid_size=(8, 6)):
+        Environment.check_grid(grid_size)
+        self.n_worlds = n_worlds
+        self.num_dummies = num_dummies
+        self.num_agents = num_dummies + 1
+        self.primary = num_dummies  # primary agent is created last, so it is updated last
+        self.enforce_deadline = enforce_deadline
+
+        # Per-world random streams
+        if seed is None:
+            seed = random.randint(0, 2 ** 31 - 1)
+        self.seeds = [seed + i for i in xrange(n_worlds)]
+        self.rngs = [RandomStream(s).random_state for s in self.seeds]
+        self.rand_buffer = np.empty((n_worlds, self.rand_block_size))
+        self.rand_pos = np.zeros(n_worlds, dtype=int)
+        for i in xrange(n_worlds):
+            self.rand_buffer[i] = self.rngs[i].random_sample(self.rand_block_size)
+
+        # Road network (same layout as Environment)
+        self.grid_size = grid_size  # (cols, rows)
+        self.bounds = (1, 1, self.grid_size[0], self.grid_size[1])
+        self.intersection_keys = [(x, y) for x in xrange(self.bounds[0], self.bounds[2] + 1)
+                                  for y in xrange(self.bounds[1], self.bounds[3] + 1)]
+        n_intersections = len(self.intersection_keys)
+
+        # World state
+        shape = (n_worlds, self.num_agents)
+        self.world_index = np.arange(n_worlds)
+        self.t = np.zeros(n_worlds, dtype=int)
+        self.done = np.zeros(n_worlds, dtype=bool)
+        self.location = np.zeros(shape + (2,), dtype=int)
+        self.heading = np.zeros(shape + (2,), dtype=int)
+        self.heading[:, :, 1] = 1  # (0, 1), as in Environment.create_agent()
+        self.waypoint = np.zeros(shape, dtype=int)
+        self.destination = np.zeros((n_worlds, 2), dtype=int)
+        self.deadline = np.zeros(n_worlds, dtype=int)
+        self.light_state = np.zeros((n_worlds, n_intersections), dtype=bool)  # True = NS open, False = EW open
+        self.light_period = np.zeros((n_worlds, n_intersections), dtype=int)
+        self.light_last_updated = np.zeros((n_worlds, n_intersections), dtype=int)
+
+        # Trial data (updated at the end of each trial)
+        self.net_reward = np.zeros(n_worlds)
+        self.final_deadline = np.zeros(n_worlds, dtype=int)
+        self.success = np.zeros(n_worlds, dtype=int)
+
+        # Replay Environment.__init__() and create_agent() draws for each world
+        for i in xrange(n_worlds):
+            for j in xrange(n_intersections):
+                self.light_state[i, j] = self._choice(i, TrafficLight.valid_states)
+                self.light_period[i, j] = self._choice(i, [3, 4, 5])
+            for k in xrange(self.num_dummies):
+                self.waypoint[i, k] = self._choice(i, range(1, len(Environment.valid_actions)))
+                self._choice(i, DummyAgent.color_choices)  # color, only drawn to keep the stream aligned
+                self.location[i, k] = self._choice(i, self.intersection_keys)
+            self.location[i, self.primary] = self._choice(i, self.intersection_keys)
+
+    def reset(self, worlds=None):
+        """Start a new trial in the given worlds (a boolean mask or indices; default: all)."""
+        if worlds is None:
+            worlds = self.world_index
+        elif np.asarray(worlds).dtype == bool:
+            worlds = np.flatnonzero(worlds)
+
+        for i in worlds:
+            self.done[i] = False
+            self.t[i] = 0
+            self.light_last_updated[i] = 0
+
+            # Pick a start and a destination that are not too close
+            start = self._choice(i, self.intersection_keys)
+            destination = self._choice(i, self.intersection_keys)
+            while self.compute_dist(start, destination) < Environment.min_trip_distance:
+                start = self._choice(i, self.intersection_keys)
+                destination = self._choice(i, self.intersection_keys)
+
+            start_heading = self._choice(i, Environment.valid_headings)
+            deadline = self.compute_dist(start, destination) * 5
+
+            for k in xrange(self.num_dummies):
+                self.location[i, k] = self._choice(i, self.intersection_keys)
+                self.heading[i, k] = self._choice(i, Environment.valid_headings)
+            self.location[i, self.primary] = start
+            self.heading[i, self.primary] = start_heading
+            self.destination[i] = destination
+            self.deadline[i] = deadline
+
+            self.net_reward[i] = 0.0
+            self.final_deadline[i] = deadline
+            self.success[i] = 0
+
+    def step(self, policy):
+        """Advance every world that is not done by one tick.
+
+        policy(inputs, deadline, waypoint) is called once per step, at the
+        primary agent's turn, with arrays for all worlds and must return an
+        array of action codes. Returns the primary agent's rewards (0 for
+        worlds that were already done).
+        """
+        active = ~self.done
+        self._refill_rand_buffer()
+
+        # Update traffic lights
+        switch = active[:, np.newaxis] & (self.t[:, np.newaxis] - self.light_last_updated >= self.light_period)
+        self.light_state ^= switch
+        self.light_last_updated = np.where(switch, self.t[:, np.newaxis], self.light_last_updated)
+
+        # Update dummy agents (DummyAgent.update)
+        for k in xrange(self.num_dummies):
+            inputs = self.sense(k)
+            waypoint = self.waypoint[:, k].copy()
+            red = ~inputs['light']
+            action_okay = ~(((waypoint == RIGHT) & red & (inputs['left'] == FORWARD)) |
+                            ((waypoint == FORWARD) & red) |
+                            ((waypoint == LEFT) & (red | (inputs['oncoming'] == FORWARD) | (inputs['oncoming'] == RIGHT))))
+            action = np.where(action_okay, waypoint, NONE)
+            redraw = np.flatnonzero(active & action_okay)
+            self.waypoint[redraw, k] = 1 + (self._uniform(redraw) * (len(Environment.valid_actions) - 1)).astype(int)
+            self.act(k, action, active, inputs)
+
+        # Update primary agent
+        p = self.primary
+        self.waypoint[active, p] = self.next_waypoint()[active]
+        inputs = self.sense(p)
+        action = np.asarray(policy(inputs, self.deadline.copy(), self.waypoint[:, p].copy()))
+        reward = self.act(p, action, active, inputs)
+        self.waypoint[active, p] = self.next_waypoint()[active]  # as LearningAgent refreshes it after acting
+
+        # Check deadlines of worlds that are still running
+        running = active & ~self.done
+        hit_limit = running & ((self.deadline <= Environment.hard_time_limit) |
+                               (self.enforce_deadline & (self.deadline <= 0)))
+        self.done |= hit_limit
+        self.deadline[running] -= 1
+        self.t[running] += 1
+
+        return reward
+
+    def sense(self, k):
+        """Inputs sensed by agent k in every world, as in Environment.sense()."""
+        location = self.location[:, k]
+        heading = self.heading[:, k]
+        light_state = self.light_state[self.world_index, self.intersection_index(location)]
+        green = (light_state & (heading[:, 1] != 0)) | (~light_state & (heading[:, 0] != 0))
+
+        oncoming = np.zeros(self.n_worlds, dtype=int)
+        left = np.zeros(self.n_worlds, dtype=int)
+        right = np.zeros(self.n_worlds, dtype=int)
+        for j in xrange(self.num_agents):
+            if j == k:
+                continue
+            other_heading = self.heading[:, j]
+            present = (self.location[:, j] == location).all(axis=1) & (other_heading != heading).any(axis=1)
+            if not present.any():
+                continue
+            other_waypoint = self.waypoint[:, j]
+            is_oncoming = present & ((heading * other_heading).sum(axis=1) == -1)
+            is_right = present & ~is_oncoming & (heading[:, 1] == other_heading[:, 0]) & (-heading[:, 0] == other_heading[:, 1])
+            is_left = present & ~is_oncoming & ~is_right
+            # Don't override oncoming == 'left', right == 'forward'/'left' or left == 'forward'
+            oncoming = np.where(is_oncoming & (oncoming != LEFT), other_waypoint, oncoming)
+            right = np.where(is_right & (right != FORWARD) & (right != LEFT), other_waypoint, right)
+            left = np.where(is_left & (left != FORWARD), other_waypoint, left)
+
+        return {'light': green, 'oncoming': oncoming, 'left': left, 'right': right}
+
+    def act(self, k, action, active, inputs):
+        """Apply action codes for agent k in the active worlds, as in Environment.act()."""
+        heading = self.heading[:, k]
+        green = inputs['light']
+
+        # Move agent if it obeys traffic rules
+        turn_left = action == LEFT
+        turn_right = action == RIGHT
+        move_okay = ~(((action == FORWARD) & ~green) |
+                      (turn_left & ~(green & ((inputs['oncoming'] == NONE) | (inputs['oncoming'] == LEFT)))) |
+                      (turn_right & ~(green | (inputs['left'] != FORWARD))))
+        new_heading = heading.copy()
+        new_heading[turn_left] = np.column_stack((heading[turn_left, 1], -heading[turn_left, 0]))
+        new_heading[turn_right] = np.column_stack((-heading[turn_right, 1], heading[turn_right, 0]))
+
+        moved = active & move_okay & (action != NONE)
+        self.location[moved, k] = self.wrap(self.location[moved, k] + new_heading[moved])
+        self.heading[moved, k] = new_heading[moved]
+        reward = np.where(move_okay, np.where(action != NONE, np.where(action == self.waypoint[:, k], 2.0, -0.5), 0.0), -1.0)
+        reward[~active] = 0.0
+
+        if k == self.primary:
+            arrived = active & (self.location[:, k] == self.destination).all(axis=1)
+            on_time = arrived & (self.deadline >= 0)
+            reward[on_time] += 10  # bonus
+            self.success[on_time] = 1
+            self.done |= arrived
+            self.final_deadline[active] = self.deadline[active]
+            self.net_reward += reward
+
+        return reward
+
+    def next_waypoint(self):
+        """Primary agent's waypoint in every world, as in RoutePlanner.next_waypoint()."""
+        location = self.location[:, self.primary]
+        heading = self.heading[:, self.primary]
+        delta = self.destination - location
+        dx, dy = delta[:, 0], delta[:, 1]
+        hx, hy = heading[:, 0], heading[:, 1]
+        return np.select(
+            [(dx == 0) & (dy == 0),
+             (dx != 0) & (dx * hx > 0), (dx != 0) & (dx * hx < 0), (dx != 0) & (dx * hy > 0), dx != 0,
+             dy * hy > 0, dy * hy < 0, dy * hx > 0],
+            [NONE,
+             FORWARD, RIGHT, LEFT, RIGHT,
+             FORWARD, RIGHT, RIGHT],
+            default=LEFT)
+
+    def intersection_index(self, location):
+        """Index into intersection_keys (and the light arrays) for an array of locations."""
+        return (location[..., 0] - self.bounds[0]) * (self.bounds[3] - self.bounds[1] + 1) + (location[..., 1] - self.bounds[1])
+
+    def wrap(self, location):
+        """Wrap-around locations that moved off the grid."""
+        low = np.array(self.bounds[:2])
+        size = np.array(self.bounds[2:]) - low + 1
+        return (location - low) % size + low
+
+    def compute_dist(self, a, b):
+        """L1 distance between two points."""
+        return abs(b[0] - a[0]) + abs(b[1] - a[1])
+
+    def _choice(self, i, seq):
+        """RandomStream.choice() on world i's stream (one uniform per draw)."""
+        if self.rand_pos[i] == self.rand_block_size:
+            self._refill_rand_buffer([i])
+        u = self.rand_buffer[i, self.rand_pos[i]]
+        self.rand_pos[i] += 1
+        return seq[int(u * len(seq))]
+
+    def _uniform(self, worlds):
+        """Next uniform from each of the given worlds' streams."""
+        u = self.rand_buffer[worlds, self.rand_pos[worlds]]
+        self.rand_pos[worlds] += 1
+        return u
+
+    def _refill_rand_buffer(self, worlds=None):
+        """Top up buffers that could run out during one step, keeping unused values in order."""
+        if worlds is None:
+            worlds = np.flatnonzero(self.rand_block_size - self.rand_pos < self.num_dummies)
+        for i in worlds:
+            remaining = self.rand_buffer[i, self.rand_pos[i]:].copy()
+            self.rand_buffer[i, :len(remaining)] = remaining
+            self.rand_buffer[i, len(remaining):] = self.rngs[i].random_sample(self.rand_block_size - len(remaining))
+            self.rand_pos[i] = 0
+
+
+def run():
+    """Drive a batch of worlds with a waypoint-following policy and report throughput."""
+
+    n_worlds = 256
+    n_trials = 10
+
+    def follow_waypoint(inputs, deadline, waypoint):
+        return waypoint
+
+    env = VectorEnvironment(n_worlds, enforce_deadline=True)
+    n_steps = 0
+    start_time = time.time()
+    for trial in xrange(n_trials):
+        env.reset()
+        while not env.done.all():
+            n_steps += np.count_nonzero(~env.done)
+            env.step(follow_waypoint)
+        print "VectorEnvironment: Trial {}, success rate = {:.2f}, mean net_reward = {:.2f}".format(
+            trial, env.success.mean(), env.net_reward.mean())
+    elapsed = time.time() - start_time
+    print "VectorEnvironment: {} worlds x {} trials in {:.3f} secs ({:.1f} world-steps/sec)".format(
+        n_worlds, n_trials, elapsed, n_steps / elapsed)
+
+
+if __name__ == '__main__':
+    run()